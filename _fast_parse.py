@@ -0,0 +1,192 @@
+import numpy as np
+from numba import jit
+
+# lower case words accepted for special float values (like float() does, case insensitive)
+_INF = np.frombuffer(b"inf", dtype=np.uint8)
+_INFINITY_TAIL = np.frombuffer(b"inity", dtype=np.uint8)
+_NAN = np.frombuffer(b"nan", dtype=np.uint8)
+
+_INT64_MAX = np.iinfo(np.int64).max
+
+
+@jit("boolean(uint8)", nopython=True, cache=True)
+def _is_separator(c):
+    # space, tab, newline, carriage return and comma
+    return c == 32 or c == 9 or c == 10 or c == 13 or c == 44
+
+
+@jit("int64(uint8[:], int64)", nopython=True, cache=True)
+def _skip_to_next_line(buf, i):
+    n = buf.shape[0]
+    while i < n and buf[i] != 10:
+        i += 1
+    return i + 1
+
+
+@jit(nopython=True, cache=True)
+def _starts_with(buf, i, word):
+    """true if the (lower case ascii) word starts at position i of buf, ignoring the case of buf"""
+    if i + word.shape[0] > buf.shape[0]:
+        return False
+    for k in range(word.shape[0]):
+        if (buf[i + k] | 32) != word[k]:
+            return False
+    return True
+
+
+@jit("int64(uint8[:])", nopython=True, cache=True)
+def _max_n_values(buf):
+    """upper bound for the number of lines (i.e. values) in the buffer"""
+    n_lines = 1
+    for c in buf:
+        if c == 10:
+            n_lines += 1
+    return n_lines
+
+
+@jit("int64[:](uint8[:])", nopython=True, cache=True)
+def parse_ints(buf):
+    """
+    Parse the first integer of every line of a text file
+    :param buf: numpy array of dtype uint8 with the raw bytes of the file (e.g. from np.fromfile(path, dtype=np.uint8))
+    :return: numpy array of int64 with one value per non empty line
+    :raises ValueError: if the first entry of a line is not an integer
+    :raises OverflowError: if a value does not fit into int64
+    """
+    n = buf.shape[0]
+    out = np.empty(_max_n_values(buf), dtype=np.int64)
+    n_values = 0
+    i = 0
+    while i < n:
+        c = buf[i]
+        if _is_separator(c):
+            i += 1
+            continue
+
+        sign = 1
+        if c == 45: # '-'
+            sign = -1
+            i += 1
+        elif c == 43: # '+'
+            i += 1
+
+        value = 0
+        n_digits = 0
+        while i < n and 48 <= buf[i] <= 57:
+            digit = buf[i] - 48
+            if value > (_INT64_MAX - digit) // 10:
+                raise OverflowError("Integer in file does not fit into int64")
+            value = value * 10 + digit
+            n_digits += 1
+            i += 1
+
+        if n_digits == 0:
+            raise ValueError("Could not parse integer, no digits in file entry")
+        if i < n and not _is_separator(buf[i]):
+            raise ValueError("Could not parse integer, unexpected character in file")
+
+        out[n_values] = sign * value
+        n_values += 1
+        i = _skip_to_next_line(buf, i)
+
+    return out[:n_values]
+
+
+@jit("float64[:](uint8[:])", nopython=True, cache=True)
+def parse_floats(buf):
+    """
+    Parse the first floating point number of every line of a text file. (e.g. 0.25, -1.5e-3, nan, -inf)
+    nan, inf and infinity are accepted in any case, like float() does.
+    :param buf: numpy array of dtype uint8 with the raw bytes of the file (e.g. from np.fromfile(path, dtype=np.uint8))
+    :return: numpy array of float64 with one value per non empty line
+    :raises ValueError: if the first entry of a line is not a number
+    """
+    n = buf.shape[0]
+    out = np.empty(_max_n_values(buf), dtype=np.float64)
+    n_values = 0
+    i = 0
+    while i < n:
+        c = buf[i]
+        if _is_separator(c):
+            i += 1
+            continue
+
+        sign = 1.0
+        if c == 45: # '-'
+            sign = -1.0
+            i += 1
+        elif c == 43: # '+'
+            i += 1
+
+        if _starts_with(buf, i, _INF):
+            i += 3
+            if _starts_with(buf, i, _INFINITY_TAIL):
+                i += 5
+            mantissa = np.inf
+        elif _starts_with(buf, i, _NAN):
+            i += 3
+            mantissa = np.nan
+        else:
+            mantissa = 0.0
+            n_digits = 0
+            while i < n and 48 <= buf[i] <= 57:
+                mantissa = mantissa * 10.0 + (buf[i] - 48)
+                n_digits += 1
+                i += 1
+
+            if i < n and buf[i] == 46: # '.'
+                i += 1
+                scale = 1.0
+                while i < n and 48 <= buf[i] <= 57:
+                    mantissa = mantissa * 10.0 + (buf[i] - 48)
+                    scale *= 10.0
+                    n_digits += 1
+                    i += 1
+                mantissa /= scale
+
+            if n_digits == 0:
+                raise ValueError("Could not parse float, no digits in file entry")
+
+            if i < n and (buf[i] == 101 or buf[i] == 69): # 'e' or 'E'
+                i += 1
+                exp_sign = 1
+                if i < n and buf[i] == 45:
+                    exp_sign = -1
+                    i += 1
+                elif i < n and buf[i] == 43:
+                    i += 1
+                exponent = 0
+                n_exp_digits = 0
+                while i < n and 48 <= buf[i] <= 57:
+                    exponent = exponent * 10 + (buf[i] - 48)
+                    n_exp_digits += 1
+                    i += 1
+                if n_exp_digits == 0:
+                    raise ValueError("Could not parse float, no digits in exponent")
+                mantissa *= 10.0 ** (exp_sign * exponent)
+
+        if i < n and not _is_separator(buf[i]):
+            raise ValueError("Could not parse float, unexpected character in file")
+
+        out[n_values] = sign * mantissa
+        n_values += 1
+        i = _skip_to_next_line(buf, i)
+
+    return out[:n_values]
+
+
+def load_int_column(path, dtype=np.int32):
+    """
+    read the first column of a text file with one integer per line into a numpy array of the given dtype
+    :raises OverflowError: if a value does not fit into dtype
+    """
+    values = parse_ints(np.fromfile(path, dtype=np.uint8))
+    limits = np.iinfo(dtype)
+    if len(values) and (values.min() < limits.min or values.max() > limits.max):
+        raise OverflowError("Values in {} do not fit into {}".format(path, np.dtype(dtype)))
+    return values.astype(dtype)
+
+
+def load_float_column(path, dtype=np.float32):
+    """read the first column of a text file with one float per line into a numpy array of the given dtype"""
+    return parse_floats(np.fromfile(path, dtype=np.uint8)).astype(dtype)
@@ -1,81 +1,95 @@
-import csv
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import warnings
 import pandas as pd
 
 from . import helper
+from . import _fast_parse
 
-def pandas_load_spikes(pathtofolder, binaryfile=True, input_neurons=False):
+def pandas_load_spikes(pathtofolder, binaryfile=True, input_neurons=False, mmap=False):
     """
     Function to extract spikes from a binary or text file
 
     Args:
         pathtofolder: String, Indicates path to output folder containing SpikeIDs/Times files
         binaryfile: Boolean Flag, Indicates if the output to expect is .bin or .txt (True/False)
+        mmap: Boolean Flag, if True binary files are memory mapped (read only) instead of read into memory
 
     Returns:
         pandas data frame with columns "ids" and "times" for the neuron id and spike time
+        (the columns share memory with the loaded arrays, no copy is made)
     """
-    ids, times = get_spikes(pathtofolder=pathtofolder, binaryfile=binaryfile, input_neurons=input_neurons)
-    return pd.DataFrame({"ids": ids, "times": times})
+    ids, times = get_spikes(pathtofolder=pathtofolder, binaryfile=binaryfile, input_neurons=input_neurons, mmap=mmap)
+    return pd.DataFrame({"ids": ids, "times": times}, copy=False)
 
 
-def get_spikes(pathtofolder, binaryfile, input_neurons=False):
+def load_spike_arrays(pathtofolder, binaryfile=True, input_neurons=False, mmap=False):
+    """
+    Same as pandas_load_spikes, but the spikes are kept as plain numpy arrays in their native dtype (no pandas dataframe)
+
+    Returns:
+        helper.NeuronArrays with columns "ids" and "times"
+    """
+    ids, times = get_spikes(pathtofolder=pathtofolder, binaryfile=binaryfile, input_neurons=input_neurons, mmap=mmap)
+    return helper.NeuronArrays(ids=ids, times=times)
+
+
+def get_spikes(pathtofolder, binaryfile, input_neurons=False, mmap=False):
     """
     Function to extract spike times and IDs from a binary or text file
 
     Args:
         pathtofolder: String, Indicates path to output folder containing SpikeIDs/Times files
         binaryfile: Boolean Flag, Indicates if the output to expect is .bin or .txt (True/False)
+        mmap: Boolean Flag, if True binary files are memory mapped (read only) instead of read into memory. (no effect for text files)
 
     Returns:
         ids: numpy array of neuron ids for each spike
         times: numpy array of spike times for each spike (corresponding to the ids
     """
-    spike_ids = list()
-    spike_times = list()
     id_filename = 'Neurons_SpikeIDs_Untrained_Epoch0'
     times_filename = 'Neurons_SpikeTimes_Untrained_Epoch0'
     if (input_neurons):
         id_filename = 'Input_' + id_filename
         times_filename = 'Input_' + times_filename
     if (binaryfile):
-        idfile = np.fromfile(pathtofolder +
-                             id_filename + '.bin',
-                             dtype=np.uint32)
-        timesfile = np.fromfile(pathtofolder +
-                                times_filename + '.bin',
-                                dtype=np.float32)
+        idfile = _load_binary(pathtofolder + id_filename + '.bin', np.uint32, mmap)
+        timesfile = _load_binary(pathtofolder + times_filename + '.bin', np.float32, mmap)
         return idfile, timesfile
     else:
-        # Getting the SpikeIDs and SpikeTimes
-        idfile = open(pathtofolder +
-                      id_filename + '.txt', 'r')
-        timesfile = open(pathtofolder +
-                         times_filename + '.txt', 'r')
-
-        # Read IDs
-        try:
-            reader = csv.reader(idfile)
-            for row in reader:
-                spike_ids.append(int(row[0]))
-        finally:
-            idfile.close()
-        # Read times
-        try:
-            reader = csv.reader(timesfile)
-            for row in reader:
-                spike_times.append(float(row[0]))
-        finally:
-            timesfile.close()
-        return (np.array(spike_ids).astype(np.int),
-                np.array(spike_times).astype(np.float))
-
-
-
-def load_spikes_from_subfolders(masterpath, subfolders, extensions, input_layer):
+        # ids are parsed as signed ints because input neurons have negative ids
+        ids = _fast_parse.load_int_column(pathtofolder + id_filename + '.txt', dtype=np.int32)
+        times = _fast_parse.load_float_column(pathtofolder + times_filename + '.txt', dtype=np.float32)
+        return ids, times
+
+
+def _load_binary(path, dtype, mmap=False):
+    """
+    Load a binary file of the given dtype into a numpy array.
+
+    :param path: path to the file
+    :param dtype: numpy dtype of the values in the file
+    :param mmap: if True the file is memory mapped read only (pages are only loaded when accessed)
+    :return: 1d numpy array (np.memmap if mmap is True)
+    """
+    if not mmap:
+        return np.fromfile(path, dtype=dtype)
+
+    itemsize = np.dtype(dtype).itemsize
+    file_size = os.path.getsize(path)
+    if file_size % itemsize != 0:
+        raise ValueError("The size of {} ({} bytes) is not a multiple of the size of {}".format(path, file_size, np.dtype(dtype).name))
+    if file_size == 0:
+        # np.memmap can't map empty files
+        return np.empty(0, dtype=dtype)
+
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+
+def load_spikes_from_subfolders(masterpath, subfolders, extensions, input_layer, max_workers=None):
     """
     Imports the ids and times for all supfolders and stores them in a list of pandas data frames
 
@@ -85,39 +99,30 @@ def load_spikes_from_subfolders(masterpath, subfolders, extensions, input_layer)
                     If only one is of interest use ["ParameterTest_0_epochs/"]
         extensions: All epochs that are supposed to be imported (i.e. ["initial/""] or ["initial", "testing/epoch1/", "testing/epoch2/", ..., "testing/epoch_n/"])
         input_layer: If you want to look at the input layer only set this to true.
+        max_workers: number of threads used to read the files in parallel (default: min(8, number of files))
 
     Returns:
         all_subfolders: all supfolder spikes. shape [subfolder][extension]-> pandas data frame with all the spikes
     """
     print("Start")
-    all_subfolders = list()
-    if input_layer:
-        for subfol in subfolders:
-            print(subfol)
-            # print(subfolders[subfol])
-            for ext in extensions:
-                all_extensions = list()
-                currentpath = masterpath + "/" + subfol + "/" + ext + "/"
-                spikes = pandas_load_spikes(currentpath, True, True)
-                all_extensions.append(spikes)
-
-            all_subfolders.append(all_extensions)
-    else:
-        for subfol in subfolders:
-            all_extensions = list()
-            for ext in extensions:
-                currentpath = masterpath + "/" + subfol + "/" + ext + "/"
-                spikes = pandas_load_spikes(currentpath, True)
-                all_extensions.append(spikes)
+    all_paths = [masterpath + "/" + subfol + "/" + ext + "/" for subfol in subfolders for ext in extensions]
+
+    if max_workers is None:
+        max_workers = max(1, min(8, len(all_paths)))
+
+    # the reads are independent and numpy releases the GIL while reading, so threads are enough
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        all_spikes = list(executor.map(lambda path: pandas_load_spikes(path, True, input_layer), all_paths))
 
-            all_subfolders.append(all_extensions)
+    n_ext = len(extensions)
+    all_subfolders = [all_spikes[i * n_ext:(i + 1) * n_ext] for i in range(len(subfolders))]
 
     return all_subfolders
 
 
 
 
-def load_network(pathtofolder, binaryfile=True, initial_weights=False):
+def load_network(pathtofolder, binaryfile=True, initial_weights=False, mmap=False):
     """
     Function to extract the pre, post, weight and delays of a network structure
 
@@ -125,6 +130,7 @@ def load_network(pathtofolder, binaryfile=True, initial_weights=False):
         pathtofolder: string path to the folder in which network files are stored
         binaryfile: True/False flag if it is binary file
         intial_weighs: True/False flag wether to load initial weights
+        mmap: True/False flag, if True binary files are memory mapped (read only) instead of read into memory
 
     Returns:
         Pandas data frame with the following colums:
@@ -133,73 +139,39 @@ def load_network(pathtofolder, binaryfile=True, initial_weights=False):
         delays: list of synaptic delays (in units of timesteps)
         init_weights: list of synaptic weights (before training) only if initial_weights=True
         weights: list of synaptic weights after training
+        (the columns share memory with the loaded arrays, no copy is made)
     """
     if pathtofolder[-1] != "/":
         pathtofolder += "/"
 
-    pre, post, delays, init_weights , weights = _raw_load_network(pathtofolder, binaryfile, initial_weights)
+    pre, post, delays, init_weights , weights = _raw_load_network(pathtofolder, binaryfile, initial_weights, mmap)
     data = dict(pre=pre, post=post, delays=delays, weights=weights)
     if initial_weights:
         data['init_weights'] = init_weights
 
-    return pd.DataFrame(data=data)
+    return pd.DataFrame(data=data, copy=False)
 
 
-def _raw_load_network(pathtofolder, binaryfile, initial_weights):
-    pre = list()
-    post = list()
-    delays = list()
-    if initial_weights:
-        init_weights = list()
-    else:
-        init_weights = None
-    weights = list()
+def _raw_load_network(pathtofolder, binaryfile, initial_weights, mmap=False):
+    init_weights = None
 
     if (binaryfile):
-        pre = np.fromfile(pathtofolder +
-                          'Synapses_NetworkPre' + '.bin',
-                          dtype=np.int32)
-        post = np.fromfile(pathtofolder +
-                           'Synapses_NetworkPost' + '.bin',
-                           dtype=np.int32)
-        delays = np.fromfile(pathtofolder +
-                             'Synapses_NetworkDelays' + '.bin',
-                             dtype=np.int32)
+        pre = _load_binary(pathtofolder + 'Synapses_NetworkPre' + '.bin', np.int32, mmap)
+        post = _load_binary(pathtofolder + 'Synapses_NetworkPost' + '.bin', np.int32, mmap)
+        delays = _load_binary(pathtofolder + 'Synapses_NetworkDelays' + '.bin', np.int32, mmap)
         if initial_weights:
-            init_weights = np.fromfile(pathtofolder + 'Synapses_NetworkWeights_Initial' + '.bin',
-                                       dtype=np.float32)
-        weights = np.fromfile(pathtofolder +
-                              'Synapses_NetworkWeights' + '.bin',
-                              dtype=np.float32)
+            init_weights = _load_binary(pathtofolder + 'Synapses_NetworkWeights_Initial' + '.bin', np.float32, mmap)
+        weights = _load_binary(pathtofolder + 'Synapses_NetworkWeights' + '.bin', np.float32, mmap)
 
         return pre, post, delays, init_weights, weights
     else:
-
         # For each file type output by the network, load them
-        with open(pathtofolder + 'Synapses_NetworkPre.txt', 'r') as csvfile:
-            reader = csv.reader(csvfile, delimiter=' ', quotechar='|')
-            for row in reader:
-                pre.append(int(row[0]))
-
-        with open(pathtofolder + 'Synapses_NetworkPost.txt', 'r') as csvfile:
-            reader = csv.reader(csvfile, delimiter=' ', quotechar='|')
-            for row in reader:
-                post.append(int(row[0]))
-
-        with open(pathtofolder + 'Synapses_NetworkDelays.txt', 'r') as csvfile:
-            reader = csv.reader(csvfile, delimiter=' ', quotechar='|')
-            for row in reader:
-                delays.append(int(row[0]))
+        pre = _fast_parse.load_int_column(pathtofolder + 'Synapses_NetworkPre.txt', dtype=np.int32)
+        post = _fast_parse.load_int_column(pathtofolder + 'Synapses_NetworkPost.txt', dtype=np.int32)
+        delays = _fast_parse.load_int_column(pathtofolder + 'Synapses_NetworkDelays.txt', dtype=np.int32)
         if initial_weights:
-            with open(pathtofolder + 'Synapses_NetworkWeights_Initial.txt', 'r') as csvfile:
-                reader = csv.reader(csvfile, delimiter=' ', quotechar='|')
-                for row in reader:
-                    init_weights.append(float(row[0]))
-
-        with open(pathtofolder + 'Synapses_NetworkWeights.txt', 'r') as csvfile:
-            reader = csv.reader(csvfile, delimiter=' ', quotechar='|')
-            for row in reader:
-                weights.append(float(row[0]))
+            init_weights = _fast_parse.load_float_column(pathtofolder + 'Synapses_NetworkWeights_Initial.txt', dtype=np.float32)
+        weights = _fast_parse.load_float_column(pathtofolder + 'Synapses_NetworkWeights.txt', dtype=np.float32)
 
     return (pre, post, delays, init_weights, weights)
 
@@ -292,24 +264,21 @@ def load_testing_stimuli_info(experiment_folder):
     :param experiment_folder: top level folder of the experiment
     :return: dictionary with fields 'elements', 'count', 'indices'
     """
-    objects = []
-    current_object = {'count': 0, 'elements': set(), 'indices': list()}
-    current_stim_index = 0
-    with open(experiment_folder + "/testing_list.txt", "r") as file:
-        for line in file:
-            raw_text = line.strip()
-            if raw_text == "*":
-                # make new object
-                objects.append(current_object)
-                current_object = {'count': 0, 'elements': set(), 'indices': list()}
-            else:
-                current_object['elements'].add(raw_text)
-                current_object['count'] += 1
-                current_object['indices'] += [current_stim_index]
-                current_stim_index += 1
-    objects.append(current_object)
+    with open(experiment_folder + "/testing_list.txt", "rb") as file:
+        lines = [line.strip() for line in file.read().splitlines()]
+
+    is_star = np.array([line == b"*" for line in lines], dtype=bool)
+
+    # every '*' starts a new object, so the number of stars before a line is the object it belongs to
+    object_of_stimulus = np.cumsum(is_star)[~is_star]
+    stimulus_names = [line.decode() for line, star in zip(lines, is_star) if not star]
+
+    n_objects = np.count_nonzero(is_star) + 1
+    # stimuli of object i are in start_of_object[i]:start_of_object[i+1]
+    start_of_object = np.searchsorted(object_of_stimulus, np.arange(n_objects + 1))
 
-    proper_objects = [obj for obj in objects if obj['count'] != 0]
+    proper_objects = [{'count': int(end - start), 'elements': set(stimulus_names[start:end]), 'indices': list(range(start, end))}
+                      for start, end in zip(start_of_object[:-1], start_of_object[1:]) if end > start]
     return proper_objects
 
 
@@ -86,10 +86,9 @@ def spikes_to_instantanious_FR(spikes, neuron_range, time_step, time_range=None)
     if len(spikes)==0:
         return np.array(range(t_start, t_end)) * time_step, instantanious_firing
 
-    relevant_spikes = spikes[mask].copy()
-
-    spike_times = relevant_spikes.times.values
-    spike_ids = relevant_spikes.ids.values
+    mask = np.asarray(mask)
+    spike_times = spikes.times.values[mask]
+    spike_ids = spikes.ids.values[mask]
 
     int_spike_times = np.floor((1 / time_step) * spike_times).astype(dtype=int)
 
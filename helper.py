@@ -1,5 +1,10 @@
+from math import isqrt
+from operator import itemgetter
+
 import numpy as np
 import pandas as pd
+from numba import jit, prange
+
 def splitstimuli(spikes, stimduration, spikes_can_be_modified=True, num_stimuli=None):
     """
     Converts a long spike train into separate stimuli based on stimulus duration
@@ -7,7 +12,7 @@ def splitstimuli(spikes, stimduration, spikes_can_be_modified=True, num_stimuli=
     Args:
         spikes: pandas DataFrame with ids and times
         stimduration: float indicating the length of time by which to split the stimuli
-        spikes_can_be_modified: if this is True the input variable 'spikes' will be modified. Gives a small speedup
+        spikes_can_be_modified: (no effect) the input variable 'spikes' is never modified. Kept for compatibility
         num_stimuli: (optinal) excplicitly give the number of stimuli that were presented. (for example if there was no spike in the last stimulus then we need this.
 
     Returns:
@@ -22,39 +27,38 @@ def splitstimuli(spikes, stimduration, spikes_can_be_modified=True, num_stimuli=
     if num_stimuli is None:
         num_stimuli = int(np.ceil(np.max(spikes.times) / stimduration))
 
-    spikes_per_stimulus = list()
+    times = spikes.times.values
 
-    if spikes_can_be_modified:
-        print("Original spike times were modified during spliting into stimulus")
-
-    for i in range(num_stimuli):
-        # mask = (spikes.times > (i * stimduration)) & (spikes.times < ((i + 1) * stimduration))
+    # all stimulus borders in one go, spikes of stimulus i are in boundaries[i]:boundaries[i+1]
+    boundaries = np.searchsorted(times, np.arange(num_stimuli + 1) * stimduration)
+    first, last = boundaries[0], boundaries[-1]
 
-        start_id, end_id = np.searchsorted(spikes.times, [i*stimduration, (i+1) * stimduration])
+    # same dtype as the old in place subtraction of i * stimduration, integer times become float for a float stimduration
+    stimulus_start_times = (np.arange(num_stimuli) * stimduration).astype(np.result_type(times.dtype, stimduration))
+    relative_times = times[first:last] - np.repeat(stimulus_start_times, np.diff(boundaries))
 
-        spikes_in_stim_slice = spikes.iloc[start_id:end_id]
+    other_columns = {col: spikes[col].values for col in spikes.columns if col != "times"}
 
-        if spikes_can_be_modified:
-            spikes_in_stim = spikes_in_stim_slice
-        else:
-            spikes_in_stim = spikes_in_stim_slice.copy()
+    spikes_per_stimulus = list()
 
-        # spikes_in_stim = spikes[mask].copy()
+    for i in range(num_stimuli):
+        start_id, end_id = boundaries[i], boundaries[i + 1]
 
-        # assert(np.all(spikes_in_stim == spikes_in_stim_new))
+        spikes_in_stim = {col: values[start_id:end_id] for col, values in other_columns.items()}
+        spikes_in_stim["times"] = relative_times[start_id - first:end_id - first]
 
-        spikes_in_stim.times -= (i * stimduration)
-        spikes_per_stimulus.append(spikes_in_stim)
+        spikes_per_stimulus.append(pd.DataFrame(spikes_in_stim, columns=spikes.columns, index=spikes.index[start_id:end_id]))
 
     return spikes_per_stimulus
 
 
-def nested_list_of_stimuli_2_np(all_stimuli_rates):
+def nested_list_of_stimuli_2_np(all_stimuli_rates, out=None):
     """
     Takes a nested list with firing rates and arranges them in two numpy tensors (exc, inh)
 
     Args:
         all_stimuli_rates: nested list of shape [stimulus][layer][exc/inh] -> pandas dataframe with fields "ids", "firing_rate"
+        out: (optional) tuple (excitatory, inhibitory) of preallocated numpy arrays with the correct shape to write the result into
 
     Returns:
         (excitatory, inhibitory)
@@ -65,13 +69,20 @@ def nested_list_of_stimuli_2_np(all_stimuli_rates):
     n_layer = len(all_stimuli_rates[0])
     n_neurons_exc = len(all_stimuli_rates[0][0][0])
     n_neurons_inh = len(all_stimuli_rates[0][0][1])
-    excitatory_rates = np.empty((n_stimuli, n_layer, n_neurons_exc))
-    inhibitory_rates = np.empty((n_stimuli, n_layer, n_neurons_inh))
+    if out is None:
+        excitatory_rates = np.empty((n_stimuli, n_layer, n_neurons_exc))
+        inhibitory_rates = np.empty((n_stimuli, n_layer, n_neurons_inh))
+    else:
+        excitatory_rates, inhibitory_rates = out
+        assert(excitatory_rates.shape == (n_stimuli, n_layer, n_neurons_exc))
+        assert(inhibitory_rates.shape == (n_stimuli, n_layer, n_neurons_inh))
 
     for stimulus in range(n_stimuli):
         for layer in range(n_layer):
-            excitatory_rates[stimulus, layer, :] = all_stimuli_rates[stimulus][layer][0].sort_values('ids').firing_rates # sorting should be unnecessary
-            inhibitory_rates[stimulus, layer, :] = all_stimuli_rates[stimulus][layer][1].sort_values('ids').firing_rates
+            exc, inh = all_stimuli_rates[stimulus][layer]
+            # scatter by id instead of sorting the dataframes, the result is the same in both cases
+            excitatory_rates[stimulus, layer, exc.ids.values] = exc.firing_rates.values
+            inhibitory_rates[stimulus, layer, inh.ids.values] = inh.firing_rates.values
 
     return excitatory_rates, inhibitory_rates
 
@@ -82,11 +93,19 @@ def nested_list_of_epochs_2_np(all_epoch_rates):
     :param all_epoch_rates: nested list of shape [epoch][stimulus][layer][exc/inh] -> pandas dataframe with fields "ids" firing_rate
     :return: exc, inh - each a numpy array of shape [epoch, stimulus, layer, nueron_id] -> firing rate value
     """
-    list_of_np_arrays = [nested_list_of_stimuli_2_np(epoch) for epoch in all_epoch_rates]
-    exc, inh = zip(*list_of_np_arrays)
-    # they are wrong now
-    exc_np = np.concatenate([np.expand_dims(e, 0) for e in exc], axis=0)
-    inh_np = np.concatenate([np.expand_dims(i, 0) for i in inh], axis=0)
+    n_epochs = len(all_epoch_rates)
+    n_stimuli = len(all_epoch_rates[0])
+    n_layer = len(all_epoch_rates[0][0])
+    n_neurons_exc = len(all_epoch_rates[0][0][0][0])
+    n_neurons_inh = len(all_epoch_rates[0][0][0][1])
+
+    exc_np = np.empty((n_epochs, n_stimuli, n_layer, n_neurons_exc))
+    inh_np = np.empty((n_epochs, n_stimuli, n_layer, n_neurons_inh))
+
+    # each epoch is written directly into its slice, no intermediate per epoch arrays
+    for epoch, epoch_rates in enumerate(all_epoch_rates):
+        nested_list_of_stimuli_2_np(epoch_rates, out=(exc_np[epoch], inh_np[epoch]))
+
     return exc_np, inh_np
 
 
@@ -121,12 +140,51 @@ def take_multiple_elements_from_list(input_list, ids):
     :param ids: list of integers
     :return: [obj for obj, i in enumerate(input_list) if i in ids]
     """
-    result = list()
-    for i in ids:
-        result.append(input_list[i])
-    return result
+    if len(ids) == 0:
+        return list()
+    if len(ids) == 1:
+        # itemgetter with a single index returns the element itself instead of a tuple
+        return [input_list[ids[0]]]
+    return list(itemgetter(*ids)(input_list))
+
+
+
+
+@jit(nopython=True, cache=True)
+def _id_to_position_nb(id, num_exc_neurons_per_layer, num_inh_neurons_per_layer):
+    """returns (is_excitatory, layer, id_within_layer) where id_within_layer counts only neurons of the same type"""
+    total_per_layer = num_exc_neurons_per_layer + num_inh_neurons_per_layer
+
+    layer = id // total_per_layer
+    id_within_layer = id - (layer * total_per_layer)
+
+    exc_neuron = id_within_layer < num_exc_neurons_per_layer
+    if not exc_neuron:
+        id_within_layer -= num_exc_neurons_per_layer
+
+    return exc_neuron, layer, id_within_layer
+
+
+@jit(nopython=True, cache=True)
+def _id_within_layer_to_pos_nb(neuron_id, side_length):
+    """returns (row, column) of the neuron within its layer"""
+    x = neuron_id // side_length
+    y = neuron_id % side_length
+    return y, x
+
+
+@jit(nopython=True, cache=True)
+def _position_to_id_nb(layer, neuron_id, is_excitatory, num_exc_neurons_per_layer, num_inh_neurons_per_layer):
+    first_in_layer_id = layer * (num_exc_neurons_per_layer + num_inh_neurons_per_layer)
+    if not is_excitatory:
+        first_in_layer_id += num_exc_neurons_per_layer
+    return first_in_layer_id + neuron_id
 
 
+@jit(nopython=True, parallel=True, cache=True)
+def _ids_to_positions_nb(ids, num_exc_neurons_per_layer, num_inh_neurons_per_layer, out_is_exc, out_layer, out_id_within_layer):
+    for i in prange(ids.shape[0]):
+        out_is_exc[i], out_layer[i], out_id_within_layer[i] = _id_to_position_nb(ids[i], num_exc_neurons_per_layer, num_inh_neurons_per_layer)
 
 
 def id_to_position(id, network_info, pos_as_2d=True):
@@ -139,30 +197,55 @@ def id_to_position(id, network_info, pos_as_2d=True):
     """
     num_exc_neurons_per_layer = network_info["num_exc_neurons_per_layer"]
     num_inh_neurons_per_layer = network_info["num_inh_neurons_per_layer"]
-    total_per_layer = num_exc_neurons_per_layer + num_inh_neurons_per_layer
-
-    layer = id // total_per_layer
-    id_within_layer = id - (layer * total_per_layer)
 
-    exc_neuron = id_within_layer < num_exc_neurons_per_layer
-
-    if exc_neuron:
-        n_in_layer_type = num_exc_neurons_per_layer
-    else:
-        n_in_layer_type = num_inh_neurons_per_layer
-        id_within_layer -= num_exc_neurons_per_layer
+    exc_neuron, layer, id_within_layer = _id_to_position_nb(int(id), num_exc_neurons_per_layer, num_inh_neurons_per_layer)
 
     if pos_as_2d:
-        side_length = get_side_length(n_in_layer_type)
+        if exc_neuron:
+            side_length = get_side_length(num_exc_neurons_per_layer)
+        else:
+            side_length = get_side_length(num_inh_neurons_per_layer)
 
-        x = id_within_layer // side_length
-        y = id_within_layer % side_length
+        y, x = _id_within_layer_to_pos_nb(id_within_layer, side_length)
 
         return exc_neuron, (int(layer), int(y), int(x))
     else:
         return exc_neuron, (int(layer), int(id_within_layer))
 
 
+def ids_to_positions(ids, network_info, pos_as_2d=True):
+    """
+    vectorized version of id_to_position. Converts all ids in one compiled (parallel) loop
+    :param ids: numpy array of global neuron ids
+    :param network_info: usual dict
+    :param pos_as_2d: if True the position is returned as (layer, row, column) if False as (layer, neuron_id)
+    :return: is_excitatory, layer, row, column or is_excitatory, layer, neuron_id. each a numpy array of same length as ids
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+
+    num_exc_neurons_per_layer = network_info["num_exc_neurons_per_layer"]
+    num_inh_neurons_per_layer = network_info["num_inh_neurons_per_layer"]
+
+    is_exc = np.empty(ids.shape[0], dtype=np.bool_)
+    layer = np.empty(ids.shape[0], dtype=np.int64)
+    id_within_layer = np.empty(ids.shape[0], dtype=np.int64)
+
+    _ids_to_positions_nb(ids, num_exc_neurons_per_layer, num_inh_neurons_per_layer, is_exc, layer, id_within_layer)
+
+    if not pos_as_2d:
+        return is_exc, layer, id_within_layer
+
+    side_length = np.empty(ids.shape[0], dtype=np.int64)
+    if np.any(is_exc):
+        side_length[is_exc] = get_side_length(num_exc_neurons_per_layer)
+    if not np.all(is_exc):
+        side_length[~is_exc] = get_side_length(num_inh_neurons_per_layer)
+
+    x, y = np.divmod(id_within_layer, side_length)
+
+    return is_exc, layer, y, x
+
+
 def id_within_layer_to_pos(id, network_info, exc_neuron=True):
     """
     Calculate position of neuron within its layer
@@ -186,8 +269,7 @@ def id_within_layer_to_pos(id, network_info, exc_neuron=True):
 
     side_length = get_side_length(n_in_layer_typ)
 
-    x = neuron_id // side_length
-    y = neuron_id % side_length
+    y, x = _id_within_layer_to_pos_nb(int(neuron_id), side_length)
 
     result = (int(y), int(x))
 
@@ -216,33 +298,29 @@ def position_to_id(pos, is_excitatory, network_info):
 
     num_exc_neurons_per_layer = network_info["num_exc_neurons_per_layer"]
     num_inh_neurons_per_layer = network_info["num_inh_neurons_per_layer"]
-    total_per_layer = num_exc_neurons_per_layer + num_inh_neurons_per_layer
-
-    first_in_layer_id = layer * total_per_layer
 
     if is_excitatory:
         n_in_layer_type = num_exc_neurons_per_layer
     else:
         n_in_layer_type = num_inh_neurons_per_layer
-        first_in_layer_id += num_exc_neurons_per_layer
 
-    side_length = np.sqrt(n_in_layer_type)
+    side_length = isqrt(n_in_layer_type)
+
+    if (side_length * side_length != n_in_layer_type):
+        raise RuntimeError("The number of neurons ber layer is not a square number: {}".format(n_in_layer_type))
 
     if neuron_id is None:
         neuron_id = (column * side_length) + line
 
-    if (side_length % 1 != 0):
-        raise RuntimeError("The number of neurons ber layer is not a square number: {}".format(n_in_layer_type))
-
-    id = first_in_layer_id + neuron_id
+    id = _position_to_id_nb(int(layer), int(neuron_id), bool(is_excitatory), num_exc_neurons_per_layer, num_inh_neurons_per_layer)
 
     return id
 
 def get_side_length(n_in_layer_type):
-    side_length = np.sqrt(n_in_layer_type)
-    if (side_length % 1 != 0):
+    side_length = isqrt(n_in_layer_type)
+    if (side_length * side_length != n_in_layer_type):
         raise RuntimeError("Tried to reshape something into square that wasn't actually a square number: {}".format(n_in_layer_type))
-    return int(side_length)
+    return side_length
 
 def id_to_position_input(id, n_layer, side_length):
     """
@@ -280,7 +358,7 @@ def split_exc_inh(neuron_activity, network_architecture_info):
     Splits layer into excitatory and inhibitory neurons
 
     Args:
-        neuron_activity: pandas data frame with columnd "ids" the rest is arbitrary, only one layer
+        neuron_activity: pandas data frame (or NeuronArrays) with columnd "ids" the rest is arbitrary, only one layer
         network_architecture_info: dictionary with the fields: num_exc_neurons_per_layer, num_inh_neurons_per_layer
 
     Returns:
@@ -292,9 +370,15 @@ def split_exc_inh(neuron_activity, network_architecture_info):
     num_inh_neurons_per_layer = network_architecture_info["num_inh_neurons_per_layer"]
     total_per_layer = num_exc_neurons_per_layer + num_inh_neurons_per_layer
 
-    excitatory = neuron_activity[neuron_activity.ids < num_exc_neurons_per_layer]
-    inhibitory = neuron_activity[neuron_activity.ids >= num_exc_neurons_per_layer].copy()
-    inhibitory.ids -= num_exc_neurons_per_layer
+    ids = np.asarray(neuron_activity["ids"])
+
+    is_exc = ids < num_exc_neurons_per_layer
+    exc_indices = np.flatnonzero(is_exc)
+    inh_indices = np.flatnonzero(~is_exc)
+
+    # the new inhibitory ids are computed directly from the selected rows, no copy of the table that is then modified
+    excitatory = _take_rows(neuron_activity, exc_indices)
+    inhibitory = _take_rows(neuron_activity, inh_indices, ids=ids[inh_indices] - num_exc_neurons_per_layer)
 
     return excitatory, inhibitory
 
@@ -305,11 +389,11 @@ def split_into_layers(neuron_activity, network_architecture_info):
     it is agnostic about which neuron information is saved in the table (e.g. spike timings or firing rates)
 
     Args:
-        neuron_activity:  pandas data frame with a column "ids"
+        neuron_activity:  pandas data frame (or NeuronArrays) with a column "ids"
         network_architecture_info: dictionary with the fields: num_exc_neurons_per_layer, num_inh_neurons_per_layer, num_layers
 
     Returns:
-        list of data frames each with columns ids and whater it was before. (ids are reduced to start with 0 in each layer)
+        list of data frames (or NeuronArrays if that was given) each with columns ids and whater it was before. (ids are reduced to start with 0 in each layer)
     """
     assert('ids' in neuron_activity)
 
@@ -320,18 +404,35 @@ def split_into_layers(neuron_activity, network_architecture_info):
     n_layers = network_architecture_info["num_layers"]
     total_per_layer = num_exc_neurons_per_layer + num_inh_neurons_per_layer
 
+    # layer and id within the layer for all neurons in one pass
+    layer_of, ids_within_layer = np.divmod(np.asarray(neuron_activity["ids"]), total_per_layer)
+
     for l in range(n_layers):
-        mask = (neuron_activity.ids >= (l * total_per_layer)) & (neuron_activity.ids < ((l + 1) * total_per_layer))
-        neurons_in_current_layer = neuron_activity[mask].copy()
-        neurons_in_current_layer.loc[:, 'ids'] -= l * total_per_layer
-        layerwise_activity.append(neurons_in_current_layer)
+        indices = np.flatnonzero(layer_of == l)
+        layerwise_activity.append(_take_rows(neuron_activity, indices, ids=ids_within_layer[indices]))
 
     return layerwise_activity
 
 
+def _take_rows(neuron_activity, indices, **replaced_columns):
+    """
+    Select rows of a neuron table, optionally with new values for some columns (see NeuronArrays.take)
+
+    :param neuron_activity: pandas data frame or NeuronArrays
+    :param indices: integer array with the positions of the rows to keep
+    :param replaced_columns: column_name=numpy array of length len(indices) used instead of the selected rows of that column
+    :return: same type as neuron_activity. a data frame keeps the index of the selected rows
+    """
+    if isinstance(neuron_activity, pd.DataFrame):
+        selected = NeuronArrays.from_frame(neuron_activity).take(indices, **replaced_columns)
+        return selected.to_frame(index=neuron_activity.index[indices])
+    return neuron_activity.take(indices, **replaced_columns)
+
+
 
 def _combine_spike_ids_and_times(ids, times):
-    return pd.DataFrame({"ids": ids, "times": times})
+    # copy=False: the dataframe shares the buffers of ids and times instead of copying them
+    return pd.DataFrame({"ids": ids, "times": times}, copy=False)
 
 
 def z_transform(data, axis=0):
@@ -341,12 +442,17 @@ def z_transform(data, axis=0):
     :param axis: defaults to 0 which for data of shape [stimulus, layer, neuron_id] gives you the relative response for each stimulus
     :return:
     """
-    mean = np.mean(data, axis=axis)
-    sigma = np.std(data, axis=axis)
+    mean = np.mean(data, axis=axis, keepdims=True)
+    sigma = np.std(data, axis=axis, keepdims=True)
 
-    transformed = (data - mean) / sigma
+    # sigma is nan if there was a nan in the data, and 0 if all values were the same. Both give 0 (as nan_to_num did before)
+    valid = sigma > 0
 
-    return np.nan_to_num(transformed)
+    transformed = np.subtract(data, mean)
+    np.divide(transformed, sigma, out=transformed, where=valid)
+    np.copyto(transformed, 0, where=~valid)
+
+    return transformed
 
 
 
@@ -356,21 +462,22 @@ def reshape_into_2d(unshaped):
     Args:
         unshaped: numpy array of shape [..., n_neurons]
     Returns:
-        numpy array of shape [..., sqrt(n_neurons), sqrt(n_neurons]
+        numpy array of shape [..., sqrt(n_neurons), sqrt(n_neurons]. This is always a view of unshaped (no copy)
     Raises:
         Exception if n_neurons is not a square
     """
     dimensions = unshaped.shape
     n_neurons = dimensions[-1]
 
-    side_length = np.sqrt(n_neurons)
-    if(side_length % 1 != 0):
+    side_length = isqrt(n_neurons)
+    if(side_length * side_length != n_neurons):
         raise RuntimeError("The last dimension is not a square number: {}".format(n_neurons))
 
-    side_length = int(side_length)
-
 
-    return np.reshape(unshaped, dimensions[:-1] + (side_length, side_length), order="F")
+    # neuron_id = column * side_length + row (same as a reshape with order="F" of the last dimension)
+    # splitting only the last axis in C order and swapping the two new axes is guaranteed to be a view,
+    # no matter how the rest of the array is laid out in memory
+    return np.reshape(unshaped, dimensions[:-1] + (side_length, side_length)).swapaxes(-1, -2)
 
 
 def epoch_subfolders_to_tensor(all_epochs):
@@ -412,12 +519,18 @@ def object_list_2_boolean_label(object_list):
     :return: numpy array of shape [n_objects, n_stimuli] -> True if the object is present in that stimulus
     """
     n_objects = len(object_list)
-    n_stimuli = np.sum([o['count'] for o in object_list])
+    n_stimuli = int(np.sum([o['count'] for o in object_list]))
 
     label_for_classifier = np.zeros((n_objects, n_stimuli), dtype=bool)
 
-    for i, o in enumerate(object_list):
-        label_for_classifier[i, o['indices']] = True
+    if n_objects == 0:
+        return label_for_classifier
+
+    # all (object, stimulus) pairs at once, then a single scatter
+    obj_ids = np.repeat(np.arange(n_objects), [len(o['indices']) for o in object_list])
+    stim_ids = np.concatenate([np.asarray(o['indices'], dtype=np.int64) for o in object_list])
+
+    label_for_classifier[obj_ids, stim_ids] = True
 
     return label_for_classifier
 
@@ -463,18 +576,41 @@ def ids_to_bool_array(ids):
 
     matrix = np.zeros((n_objs, n_stims), dtype=bool)
 
-    for obj_id, obj in enumerate(ids):
-        matrix[obj_id, obj] = True
+    # all (object, stimulus) pairs at once, then a single scatter
+    obj_ids = np.repeat(np.arange(n_objs), [len(obj) for obj in ids])
+    stim_ids = np.concatenate([np.asarray(obj, dtype=np.int64) for obj in ids])
+
+    matrix[obj_ids, stim_ids] = True
 
     return matrix
 
 
 def max_of_nested_array(arr):
-    """rekursivly compute the maximum number in a arbitrary nested structure of arrays"""
+    """compute the maximum number in a arbitrary nested structure of arrays (iterativly, with an explicit stack)"""
     if type(arr) != list:
         return arr
-    else:
-        return max([max_of_nested_array(i) for i in arr])
+
+    best = None
+    stack = [arr]
+    while stack:
+        current = stack.pop()
+        if type(current) != list:
+            candidate = current
+        elif list in map(type, current):
+            stack.extend(current)
+            continue
+        elif current:
+            # innermost list, let the builtin max do the element loop
+            candidate = max(current)
+        else:
+            continue
+
+        if best is None or candidate > best:
+            best = candidate
+
+    if best is None:
+        raise ValueError("max_of_nested_array() arg does not contain any elements")
+    return best
 
 
 def split_into_populations(neuron_values, network_architecture_info, population_name="L{layer}_{type}"):
@@ -482,36 +618,28 @@ def split_into_populations(neuron_values, network_architecture_info, population_
     Split pandas dataframe of neurons into neuron populations. A popluation is all neurons of one type (excitatory or inhibitory)
     within one layer.
 
-    :param neuron_values: pandas dataframe with column "ids" and arbitrary additional columns
+    :param neuron_values: pandas dataframe (or NeuronArrays) with column "ids" and arbitrary additional columns
     :param network_architecture_info: dict with fields "num_exc_neurons_per_layer", "num_inh_neurons_per_layer", "num_layers"
-    :return: dictionary with population_name as key (e.g. L0_exc) and pandas dataframe with same columns as neuron_values as value
+    :return: dictionary with population_name as key (e.g. L0_exc) and pandas dataframe (or NeuronArrays) with same columns as neuron_values as value
     """
     result=dict()
 
-    # neuron_mask = NeuronMask(network_architecture_info)
-    #
-    # neuron_ids = neuron_values.ids.values
-    #
-    # for layer in range(network_architecture_info["num_layers"]):
-    #
-    #     # excitatory
-    #     name = population_name.format(layer=layer, type="exc")
-    #     # mask = neuron_mask.is_in_layer(neuron_ids, layer) & neuron_mask.is_excitatory(neuron_ids)
-    #
-    #     values = neuron_values[mask]
-    #     result[name] = values
-    #
-    #     # inhibitory
-    #     name = population_name.format(layer=layer, type="inh")
-    #     # mask = neuron_mask.is_in_layer(neuron_ids, layer) & neuron_mask.is_inhibitory(neuron_ids)
-    #     values = neuron_values[mask]
-    #     result[name] = values
-
-    pop_id_ranges = get_population_neuron_range(network_architecture_info, population_name)
-    for pop_name, id_range in pop_id_ranges.items():
-        start_id, end_id = id_range
-        mask = (start_id <= neuron_values.ids.values) & (neuron_values.ids.values < end_id)
-        result[pop_name] = neuron_values[mask]
+    neuron_mask = NeuronMask(network_architecture_info)
+
+    # one pass over the ids for both the layer and the type, the per population masks are then cheap comparisons
+    layer_of, is_exc = neuron_mask.get_layer_and_type(np.asarray(neuron_values.ids))
+    is_inh = ~is_exc
+
+    for layer in range(network_architecture_info["num_layers"]):
+        in_layer = (layer_of == layer)
+
+        # excitatory
+        name = population_name.format(layer=layer, type="exc")
+        result[name] = neuron_values[in_layer & is_exc]
+
+        # inhibitory
+        name = population_name.format(layer=layer, type="inh")
+        result[name] = neuron_values[in_layer & is_inh]
 
     return result
 
@@ -568,15 +696,21 @@ def permute_ids_within_population(neuron_ids, network_architecture_info):
 
     result = np.ones_like(neuron_ids) * np.nan
 
+    neuron_mask._check_if_in_input_layer(neuron_ids)
+
+    # one pass over the ids for both the layer and the type, the per population masks are then cheap comparisons
+    layer_of, is_exc = neuron_mask.get_layer_and_type(neuron_ids)
+    is_inh = ~is_exc
 
     for layer in range(network_architecture_info["num_layers"]):
+        in_layer = (layer_of == layer)
 
         # excitatory
-        mask = neuron_mask.is_in_layer(neuron_ids, layer) & neuron_mask.is_excitatory(neuron_ids)
+        mask = in_layer & is_exc
         result[mask] = np.random.permutation(neuron_ids[mask])
 
         # inhibitory
-        mask = neuron_mask.is_in_layer(neuron_ids, layer) & neuron_mask.is_inhibitory(neuron_ids)
+        mask = in_layer & is_inh
         result[mask] = np.random.permutation(neuron_ids[mask])
 
     assert(not np.any(np.isnan(result)))
@@ -678,7 +812,78 @@ class Caller(object):
 
 
 
+class NeuronArrays:
+    def __init__(self, **columns):
+        """
+        Table of neuron values (e.g. spikes with 'ids' and 'times' or firing rates with 'ids' and 'firing_rates')
+        stored as one plain numpy array per column. The arrays keep their native dtype (e.g. uint32 ids, float32 times),
+        which makes masking and splitting cheaper than going through a pandas dataframe.
+
+        Columns can be accessed like in a dataframe: arrays.ids or arrays['ids']. Indexing with a boolean mask or
+        integer array (arrays[mask]) returns a new NeuronArrays with the selected rows.
+
+        :param columns: column_name=numpy array, all of the same length
+        """
+        columns = {name: np.asarray(values) for name, values in columns.items()}
+        lengths = set(len(values) for values in columns.values())
+        if len(lengths) > 1:
+            raise ValueError("All columns need to have the same length, got lengths {}".format(lengths))
+        self._columns = columns
+
+    @staticmethod
+    def from_frame(data_frame):
+        """create NeuronArrays from a pandas dataframe (the column arrays are not copied)"""
+        return NeuronArrays(**{col: data_frame[col].values for col in data_frame.columns})
+
+    def to_frame(self, index=None):
+        """pandas dataframe with the same columns (sharing the memory with these arrays)"""
+        return pd.DataFrame(self._columns, index=index, columns=list(self._columns), copy=False)
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def take(self, indices, **replaced_columns):
+        """
+        select rows
+        :param indices: integer array of the rows to keep
+        :param replaced_columns: column_name=numpy array, use these values (already of length len(indices)) instead of the selected rows of that column
+        :return: NeuronArrays
+        """
+        selected = {name: (replaced_columns[name] if name in replaced_columns else values[indices]) for name, values in self._columns.items()}
+        return NeuronArrays(**selected)
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            return self._columns[item]
+        item = np.asarray(item)
+        if item.dtype == bool:
+            item = np.flatnonzero(item)
+        return self.take(item)
+
+    def __getattr__(self, name):
+        try:
+            # through __dict__ so that this also works while unpickling (before _columns exists)
+            return self.__dict__["_columns"][name]
+        except KeyError:
+            raise AttributeError("NeuronArrays has no column '{}'".format(name))
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __len__(self):
+        if not self._columns:
+            return 0
+        return len(next(iter(self._columns.values())))
+
+    def __repr__(self):
+        return "<NeuronArrays: {} rows, columns {}>".format(len(self), self.columns)
+
+
+
 class NeuronMask:
+    __slots__ = ('n_exc', 'n_inh', 'total_per_layer', 'n_layer', 'n_all_neurons', 'last_exc')
+
     def __init__(self, network_architecture_info):
         """
         Class that provides masks for a given network
@@ -709,6 +914,16 @@ class NeuronMask:
         return (neuron_ids // self.total_per_layer)
 
 
+    def get_layer_and_type(self, neuron_ids):
+        """
+        Layer number and type of each neuron, computed in a single pass over neuron_ids.
+
+        :param neuron_ids: numpy array of global neuron ids
+        :return: (layer_of, is_exc) numpy arrays of same shape as neuron_ids. layer number, True for excitatory neurons
+        """
+        layer_of, ids_within_layer = np.divmod(neuron_ids, self.total_per_layer)
+        return layer_of, ids_within_layer < self.n_exc
+
     def _id_within_layer(self, neuron_ids):
         return neuron_ids % self.total_per_layer
 
@@ -731,16 +946,92 @@ class NeuronMask:
 
         :return: numpy array of length n_to_draw
         """
-        entire_pool = np.arange(0, self.n_all_neurons)
-
-        neurons_left = entire_pool
+        if not restricting_functions:
+            restricting_functions = []
+        elif type(restricting_functions) != list:
+            restricting_functions = [restricting_functions]
+
+        id_ranges = self._id_ranges_for_restrictions(restricting_functions)
+
+        if id_ranges is not None:
+            # the valid ids are known without looking at every neuron, draw from them directly
+            layers, first_in_layer_type, n_per_layer = id_ranges
+            drawn = _draw_without_replacement(len(layers) * n_per_layer, n_to_draw)
+            layer_index, id_within_layer_type = np.divmod(drawn, max(n_per_layer, 1))
+            return layers[layer_index] * self.total_per_layer + first_in_layer_type + id_within_layer_type
+
+        # arbitrary restrictions: draw random candidates in chunks and keep the ones that fullfill all restrictions
+        collected = np.empty(0, dtype=np.int64)
+        n_tried = 0
+        while len(collected) < n_to_draw and n_tried < self.n_all_neurons:
+            candidates = np.random.randint(0, self.n_all_neurons, max(2 * (n_to_draw - len(collected)), 64))
+            n_tried += len(candidates)
+            for fun in restricting_functions:
+                candidates = candidates[fun(candidates)]
+            collected = _unique_in_order(np.concatenate([collected, candidates]))
 
-        if restricting_functions:
-            if type(restricting_functions) != list:
-                restricting_functions = [restricting_functions]
+        if len(collected) >= n_to_draw:
+            return collected[:n_to_draw]
 
-            for fun in restricting_functions:
-                neurons_left = neurons_left[fun(neurons_left)]
+        # only very few neurons fullfill the restrictions, check all of them
+        neurons_left = np.arange(0, self.n_all_neurons)
+        for fun in restricting_functions:
+            neurons_left = neurons_left[fun(neurons_left)]
 
         return np.random.choice(neurons_left, n_to_draw, replace=False)
 
+    def _id_ranges_for_restrictions(self, restricting_functions):
+        """
+        If the restrictions are only self.is_excitatory, self.is_inhibitory or Caller(self.is_in_layer, layer) the valid ids can be
+        given as ranges.
+        :return: (layers, first_in_layer_type, n_per_layer) all valid ids are layer * total_per_layer + first_in_layer_type + [0, n_per_layer)
+         for each layer in layers. None if there is a restriction that can't be expressed like this
+        """
+        layers = np.arange(self.n_layer)
+        want_exc = False
+        want_inh = False
+
+        for fun in restricting_functions:
+            if fun == self.is_excitatory:
+                want_exc = True
+            elif fun == self.is_inhibitory:
+                want_inh = True
+            elif isinstance(fun, Caller) and fun.function == self.is_in_layer and len(fun.args) == 1 and not fun.kwargs:
+                layers = layers[layers == fun.args[0]]
+            else:
+                return None
+
+        if want_exc and want_inh:
+            return layers, 0, 0
+        elif want_exc:
+            return layers, 0, self.n_exc
+        elif want_inh:
+            return layers, self.n_exc, self.n_inh
+        else:
+            return layers, 0, self.total_per_layer
+
+
+def _unique_in_order(values):
+    """unique values of a numpy array, in the order of their first occurence"""
+    _, first_occurence = np.unique(values, return_index=True)
+    return values[np.sort(first_occurence)]
+
+
+def _draw_without_replacement(pool_size, n_to_draw):
+    """
+    same as np.random.choice(pool_size, n_to_draw, replace=False) but without creating an array of size pool_size
+    if only a small part of the pool is drawn
+    """
+    if n_to_draw > pool_size:
+        raise ValueError("Cannot take a larger sample than population when 'replace=False'")
+
+    if 2 * n_to_draw > pool_size:
+        # drawing most of the pool anyway, rejecting duplicates would be slow
+        return np.random.choice(pool_size, n_to_draw, replace=False)
+
+    drawn = np.empty(0, dtype=np.int64)
+    while len(drawn) < n_to_draw:
+        new_samples = np.random.randint(0, pool_size, 2 * (n_to_draw - len(drawn)))
+        drawn = _unique_in_order(np.concatenate([drawn, new_samples]))
+
+    return drawn[:n_to_draw]
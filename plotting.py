@@ -1,11 +1,189 @@
 import matplotlib.animation as animation
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.collections import PolyCollection
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Normalize, to_rgba_array
+from matplotlib.lines import Line2D
+from numba import jit, prange
 
 from . import helper
 
 
-def show_activity_in_layers(excitatory, inhibitory, value_range=None, item_labels=None, cmap='plasma'):
+@jit(nopython=True, parallel=True, cache=True)
+def _min_max_kernel(flat, chunk_size):
+    n = flat.shape[0]
+    n_chunks = (n + chunk_size - 1) // chunk_size
+    chunk_min = np.empty(n_chunks, dtype=flat.dtype)
+    chunk_max = np.empty(n_chunks, dtype=flat.dtype)
+    chunk_nan = np.zeros(n_chunks, dtype=np.bool_)
+    for c in prange(n_chunks):
+        start = c * chunk_size
+        stop = min(start + chunk_size, n)
+        mn = flat[start]
+        mx = flat[start]
+        for i in range(start + 1, stop):
+            v = flat[i]
+            if v < mn:
+                mn = v
+            elif v > mx:
+                mx = v
+            elif v != v:
+                chunk_nan[c] = True
+        if mn != mn:
+            chunk_nan[c] = True
+        chunk_min[c] = mn
+        chunk_max[c] = mx
+    return chunk_min, chunk_max, chunk_nan
+
+
+def _min_max(values):
+    """
+    min and max of an array in a single pass (nan if the array contains nan, like np.min and np.max)
+    :param values: numpy array
+    :return: (min, max)
+    """
+    flat = np.ravel(values)
+    if flat.size == 0:
+        raise ValueError("zero-size array has no minimum and maximum")
+    # at most 64 chunks that are reduced in parallel
+    chunk_min, chunk_max, chunk_nan = _min_max_kernel(flat, -(-flat.size // 64))
+    if chunk_nan.any():
+        return np.nan, np.nan
+    return chunk_min.min(), chunk_max.max()
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _count_above(values, threshold):
+    """
+    Count the entries above threshold along the last axis without allocating the boolean array
+    :param values: numpy array of shape [item, layer, neuron_id]
+    :param threshold: scalar
+    :return: numpy array of shape [item, layer] with the counts
+    """
+    n_items, n_layers, n_neurons = values.shape
+    counts = np.zeros((n_items, n_layers), dtype=np.int64)
+    for i in prange(n_items):
+        for l in range(n_layers):
+            c = 0
+            for n in range(n_neurons):
+                if values[i, l, n] > threshold:
+                    c += 1
+            counts[i, l] = c
+    return counts
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _mean_and_count_at_least(info, threshold):
+    """
+    Mean over the neurons and number of neurons with a value >= threshold, both in a single pass over info
+    :param info: numpy array of shape [epochs, objects, layer, neuron_id]
+    :param threshold: scalar
+    :return: (mean, count) numpy arrays of shape [epochs, objects, layer]
+    """
+    n_epochs, n_objects, n_layer, n_neurons = info.shape
+    mean = np.empty((n_epochs, n_objects, n_layer), dtype=np.float64)
+    count = np.empty((n_epochs, n_objects, n_layer), dtype=np.int64)
+    for e in prange(n_epochs):
+        for o in range(n_objects):
+            for l in range(n_layer):
+                s = 0.0
+                c = 0
+                for n in range(n_neurons):
+                    v = info[e, o, l, n]
+                    s += v
+                    if v >= threshold:
+                        c += 1
+                mean[e, o, l] = s / n_neurons
+                count[e, o, l] = c
+    return mean, count
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _histogram_counts(data, bins):
+    """
+    Histogram along the last axis for all leading indices at once, same counts as np.histogram(data[e, o, l], bins=bins)
+    :param data: numpy array of shape [epochs, objects, layer, neuron_id]
+    :param bins: numpy array with n_bins + 1 equally spaced, increasing bin edges
+    :return: numpy array of shape [epochs, objects, layer, n_bins] with the counts
+    """
+    n_epochs, n_objects, n_layer, n_neurons = data.shape
+    n_bins = bins.shape[0] - 1
+    lo = bins[0]
+    hi = bins[n_bins]
+    counts = np.zeros((n_epochs, n_objects, n_layer, n_bins), dtype=np.int64)
+    norm = n_bins / (hi - lo) if hi > lo else 0.0
+    for e in prange(n_epochs):
+        for o in range(n_objects):
+            for l in range(n_layer):
+                for n in range(n_neurons):
+                    v = data[e, o, l, n]
+                    if not (lo <= v <= hi):
+                        continue
+                    if hi <= lo:
+                        b = n_bins - 1
+                    else:
+                        b = min(int((v - lo) * norm), n_bins - 1)
+                        # correct for rounding, the bin edges decide like in np.histogram
+                        if v < bins[b]:
+                            b -= 1
+                        elif b < n_bins - 1 and v >= bins[b + 1]:
+                            b += 1
+                    counts[e, o, l, b] += 1
+    return counts
+
+
+def _as_float32(values):
+    """
+    C contiguous float32 version of values (no copy if it already is one).
+    Single precision is plenty for plotting and halves the memory traffic of the animation code compared to float64.
+    """
+    return np.asarray(values, dtype=np.float32, order='C')
+
+
+def _as_images(values):
+    """
+    Reshape the last dimension of values into square images (see helper.reshape_into_2d) and store them C contiguous.
+    The reshaped view is transposed in memory and matplotlib would make a contiguous copy of an image every time it is
+    drawn, this makes that copy once for all images up front.
+    :param values: numpy array of shape [..., n_neurons]
+    :return: C contiguous numpy array of shape [..., sqrt(n_neurons), sqrt(n_neurons)]
+    """
+    return np.ascontiguousarray(helper.reshape_into_2d(values))
+
+
+def _to_uint8(values, vmin, vmax):
+    """
+    Map values onto the 256 entries of a colormap once, instead of letting matplotlib normalise the float data every
+    time an image is drawn. Shown with norm=Normalize(0, 255) the colors are the same as for the float values with
+    Normalize(vmin, vmax).
+    :param values: numpy array
+    :param vmin: value mapped to the lowest color
+    :param vmax: value mapped to the highest color
+    :return: C contiguous numpy array of dtype uint8 with the shape of values (a masked array if values contains nan)
+    """
+    nan = np.isnan(values)
+    if vmax > vmin:
+        # float32 input is scaled in float32, everything else in float64
+        scaled = np.subtract(values, vmin, dtype=np.result_type(values.dtype, np.float32), order='C')
+        scaled *= 256.0 / (vmax - vmin)
+        np.clip(scaled, 0, 255, out=scaled)
+        scaled[nan] = 0
+        normalised = scaled.astype(np.uint8)
+    else:
+        normalised = np.zeros(np.shape(values), dtype=np.uint8)
+
+    if nan.any():
+        return np.ma.masked_array(normalised, mask=nan)
+    return normalised
+
+
+def _same_image(a, b):
+    """true if the (possibly masked) images a and b have the same values and the same mask"""
+    return np.array_equal(np.ma.getdata(a), np.ma.getdata(b)) and np.array_equal(np.ma.getmask(a), np.ma.getmask(b))
+
+
+def show_activity_in_layers(excitatory, inhibitory, value_range=None, item_labels=None, cmap='plasma', save_path=None):
     """
     Plot activity or information for all items in the network. items can be stimuli or objects for example
     :param excitatory: values for excitatory neurons to be plotted, shape [item, layer, neuron_id]
@@ -13,12 +191,16 @@ def show_activity_in_layers(excitatory, inhibitory, value_range=None, item_label
     :param value_range: value range of the color map (optional)
     :param item_labels: names for the item subplots (optional)
     :param cmap: colormap (optional)
+    :param save_path: format string for a file name, e.g. 'activity_{}.png' (optional). If given a single figure is reused
+        for all items and saved once per item (with the item label filled in) instead of creating one figure per item.
     """
     n_presentation_items = excitatory.shape[0] #how many stimuli or objects
     num_layers = excitatory.shape[1]
     if not value_range:
-        vmin = min(excitatory.min(), inhibitory.min())
-        vmax = max(excitatory.max(), inhibitory.max())
+        exc_min, exc_max = _min_max(excitatory)
+        inh_min, inh_max = _min_max(inhibitory)
+        vmin = min(exc_min, inh_min)
+        vmax = max(exc_max, inh_max)
     else:
         vmin, vmax = value_range
 
@@ -30,31 +212,57 @@ def show_activity_in_layers(excitatory, inhibitory, value_range=None, item_label
         assert(len(item_labels) == n_presentation_items)
 
 
-    exc_rates_imgs = helper.reshape_into_2d(excitatory)
-    inh_rates_imgs = helper.reshape_into_2d(inhibitory)
+    exc_rates_imgs = _to_uint8(helper.reshape_into_2d(excitatory), vmin, vmax)
+    inh_rates_imgs = _to_uint8(helper.reshape_into_2d(inhibitory), vmin, vmax)
 
-    n_above_exc = np.count_nonzero(excitatory > 0.9 * vmax, axis=2)
-    n_above_inh = np.count_nonzero(inhibitory > 0.9 * vmax, axis=2)
+    n_above_exc = _count_above(excitatory, 0.9 * vmax)
+    n_above_inh = _count_above(inhibitory, 0.9 * vmax)
 
-    for item_id, item in enumerate(item_labels):
+    def make_figure():
         fig = plt.figure(figsize=(19, 8))
-        fig.suptitle("Item: {}".format(item), fontsize=16)
-
+        exc_axes = []
+        exc_ims = []
+        inh_axes = []
+        inh_ims = []
         for layer in range(num_layers):
             subPlotAX = fig.add_subplot(2, num_layers, layer + 1)
+            exc_axes.append(subPlotAX)
+            exc_ims.append(subPlotAX.imshow(exc_rates_imgs[0, layer, :, :], vmin=0, vmax=255, cmap=cmap, interpolation='nearest'))
 
+            subPlotAXinh = fig.add_subplot(2, num_layers, num_layers + layer + 1)
+            inh_axes.append(subPlotAXinh)
+            inh_ims.append(subPlotAXinh.imshow(inh_rates_imgs[0, layer, :, :], vmin=0, vmax=255, cmap=cmap, interpolation='nearest'))
 
+        # the images are already normalised to uint8, the colorbar shows the original values
+        cax = fig.add_axes([0.9, 0.1, 0.03, 0.8])
+        fig.colorbar(ScalarMappable(norm=Normalize(vmin=vmin, vmax=vmax), cmap=cmap), cax=cax)
+        return fig, exc_axes, exc_ims, inh_axes, inh_ims
 
-            subPlotAX.set_title("Excitatory - Layer {}, ({} info)".format(layer, n_above_exc[item_id, layer]))
-            subPlotAX.imshow(exc_rates_imgs[item_id, layer, :, :], vmin=vmin, vmax=vmax, cmap=cmap)
+    # all titles are formatted up front, a reused figure only gets a new title where the text changes
+    exc_titles = [["Excitatory - Layer {}, ({} info)".format(layer, n) for layer, n in enumerate(item_counts)] for item_counts in n_above_exc.tolist()]
+    inh_titles = [["Inhibitory - Layer {} ({} info)".format(layer, n) for layer, n in enumerate(item_counts)] for item_counts in n_above_inh.tolist()]
 
-            subPlotAXinh = fig.add_subplot(2, num_layers, num_layers + layer + 1)
+    fig = None
+    for item_id, item in enumerate(item_labels):
+        if fig is None or save_path is None:
+            fig, exc_axes, exc_ims, inh_axes, inh_ims = make_figure()
 
-            subPlotAXinh.set_title("Inhibitory - Layer {} ({} info)".format(layer, n_above_inh[item_id, layer]))
-            im = subPlotAXinh.imshow(inh_rates_imgs[item_id, layer, :, :], vmin=vmin, vmax=vmax, cmap=cmap)
+        fig.suptitle("Item: {}".format(item), fontsize=16)
 
-        cax = fig.add_axes([0.9, 0.1, 0.03, 0.8])
-        fig.colorbar(im, cax=cax)
+        for layer in range(num_layers):
+            if exc_axes[layer].get_title() != exc_titles[item_id][layer]:
+                exc_axes[layer].set_title(exc_titles[item_id][layer])
+            exc_ims[layer].set_data(exc_rates_imgs[item_id, layer, :, :])
+
+            if inh_axes[layer].get_title() != inh_titles[item_id][layer]:
+                inh_axes[layer].set_title(inh_titles[item_id][layer])
+            inh_ims[layer].set_data(inh_rates_imgs[item_id, layer, :, :])
+
+        if save_path is not None:
+            fig.savefig(save_path.format(item))
+
+    if save_path is not None and fig is not None:
+        plt.close(fig)
 
 
 def animate_2d_matrix(data, perf, title, label_perf=None, cmap='plasma'):
@@ -146,42 +354,46 @@ def animate_neuron_value_development(exc, inh):
     :param inh: same
     :return: Animation
     """
+    exc = _as_float32(exc)
+    inh = _as_float32(inh)
+
     n_timepoints, n_layers, _n_neurons = exc.shape
 
     max_firing_rate = max(np.max(exc), np.max(inh))
 
-    exc_img = helper.reshape_into_2d(exc)
-    inh_img = helper.reshape_into_2d(inh)
+    exc_img = _to_uint8(helper.reshape_into_2d(exc), 0, max_firing_rate)
+    inh_img = _to_uint8(helper.reshape_into_2d(inh), 0, max_firing_rate)
 
-    fig = plt.figure(figsize=(19, 8))
+    # excitatory and inhibitory layers have different sizes, so the axes are only shared within a row
+    fig, axes = plt.subplots(2, n_layers, figsize=(19, 8), sharex='row', sharey='row', squeeze=False)
+    exc_axes, inh_axes = axes[0], axes[1]
+    for ax in axes.flat:
+        ax.axis('off')
 
-    exc_axes = []
-    inh_axes = []
-    for l in range(n_layers):
-        exc_axes.append(fig.add_subplot(2, n_layers, 1 + l))
-        exc_axes[-1].axis('off')
-    for l in range(n_layers):
-        inh_axes.append(fig.add_subplot(2, n_layers, n_layers + 1 + l))
-        inh_axes[-1].axis('off')
-
-    ims = []
-    for frame in range(n_timepoints):
-        # image_arr = np.reshape(exc[3, frame, :], (64, 64), order='F')
-        images_Ex = []
-        images_In = []
-        for l in range(n_layers):
-            imEx = exc_axes[l].imshow(exc_img[frame, l, :, :], animated=True, cmap='hot', vmin=0, vmax=max_firing_rate)
-            imIn = inh_axes[l].imshow(inh_img[frame, l, :, :], animated=True, cmap='hot', vmin=0, vmax=max_firing_rate)
+    # one image per axis, the frames only replace the data of these images
+    exc_ims = [ax.imshow(exc_img[0, l, :, :], animated=True, cmap='hot', vmin=0, vmax=255, interpolation='nearest') for l, ax in enumerate(exc_axes)]
+    inh_ims = [ax.imshow(inh_img[0, l, :, :], animated=True, cmap='hot', vmin=0, vmax=255, interpolation='nearest') for l, ax in enumerate(inh_axes)]
 
-            images_Ex.append(imEx)
-            images_In.append(imIn)
+    cax = fig.add_axes([0.92, 0.17, 0.03, 0.67])
+    fig.colorbar(ScalarMappable(norm=Normalize(vmin=0, vmax=max_firing_rate), cmap='hot'), cax=cax)
 
-        ims.append(images_Ex + images_In)
+    # frame currently shown by each image, set_data is skipped if the new frame has the same values
+    exc_shown = [0] * n_layers
+    inh_shown = [0] * n_layers
 
-    cax = fig.add_axes([0.92, 0.17, 0.03, 0.67])
-    fig.colorbar(imIn, cax=cax)
+    def show_frame(ims, imgs, shown, frame):
+        for l in range(n_layers):
+            if shown[l] != frame and not _same_image(imgs[shown[l], l, :, :], imgs[frame, l, :, :]):
+                ims[l].set_data(imgs[frame, l, :, :])
+                shown[l] = frame
 
-    ani = animation.ArtistAnimation(fig, ims, interval=200, blit=True, repeat_delay=22000)
+    def update(frame):
+        show_frame(exc_ims, exc_img, exc_shown, frame)
+        show_frame(inh_ims, inh_img, inh_shown, frame)
+        # all images are returned, blitting restores the background of every axis drawn in the last frame
+        return exc_ims + inh_ims
+
+    ani = animation.FuncAnimation(fig, update, frames=n_timepoints, interval=200, blit=True, repeat_delay=22000)
     return ani
 
 def show_values_all_things(values, figure_title, thing_label = None, cmap='plasma'):
@@ -205,16 +417,19 @@ def show_values_all_things(values, figure_title, thing_label = None, cmap='plasm
     vmin =values.min()
     vmax =values.max()
 
-    fig = plt.figure(figsize=(12, 5*np.ceil(num_layers/2)),)
+    n_rows = -(-num_layers // 2)
+    fig, axes = plt.subplots(n_rows, 2, figsize=(12, 5 * n_rows), squeeze=False)
     fig.suptitle(figure_title, fontsize=16)
 
     if(len(values.shape) > 1 and values.shape[-2] != values.shape[-1]):
-        reshaped = helper.reshape_into_2d(values)
+        reshaped = _as_images(values)
     else:
         reshaped = values
 
-    for layer in range(num_layers):
-        subPlotAX = fig.add_subplot(np.ceil(num_layers/2), 2, layer + 1)
+    for layer, subPlotAX in enumerate(axes.flat):
+        if layer >= num_layers:
+            subPlotAX.axis('off')
+            continue
 
         subPlotAX.set_title(thing_label[layer])
         im = subPlotAX.imshow(reshaped[layer, :, :], vmin=vmin, vmax=vmax, cmap=cmap)
@@ -227,6 +442,21 @@ def show_values_all_things(values, figure_title, thing_label = None, cmap='plasm
 
 
 
+def _largest_descending(values, n):
+    """
+    The n largest values along the last axis in descending order, without sorting the whole axis
+    :param values: numpy array
+    :param n: number of values to keep
+    :return: numpy array of shape values.shape[:-1] + (n,)
+    """
+    n_values = values.shape[-1]
+    if n <= 0:
+        return values[..., :0]
+    top = np.partition(values, n_values - n, axis=-1)[..., n_values - n:]
+    top.sort(axis=-1)
+    return top[..., ::-1]
+
+
 def plot_information_measure_advancement(before, after, n_to_plot = 1000, item_label=None):
     assert(before.shape == after.shape)
     n_objects, n_layer, n_neurons = before.shape
@@ -236,11 +466,13 @@ def plot_information_measure_advancement(before, after, n_to_plot = 1000, item_l
     else:
         assert(len(item_label) == n_objects)
 
-    before = np.sort(before, axis=2)
-    after = np.sort(after, axis=2)
-
     vmax = max(np.max(before), np.max(after))
 
+    # same number of neurons as the slice [:-n_to_plot:-1] of the sorted values would give
+    n_top = len(range(n_neurons)[:-n_to_plot:-1])
+    before = _largest_descending(before, n_top)
+    after = _largest_descending(after, n_top)
+
 
     fig = plt.figure(figsize=(18, 10))
     fig.suptitle("Information Measure before and after", fontsize=16)
@@ -252,8 +484,8 @@ def plot_information_measure_advancement(before, after, n_to_plot = 1000, item_l
             layerAX  = fig.add_subplot(n_layer, n_objects, (n_objects * layer) + i + 1)
             layerAX.set_title("Info Item: {}, Layer {}".format(item, layer))
 
-            layerAX.plot(before[i, layer, :-n_to_plot:-1], label="before")
-            layerAX.plot( after[i, layer, :-n_to_plot:-1], label="after")
+            layerAX.plot(before[i, layer, :], label="before")
+            layerAX.plot( after[i, layer, :], label="after")
 
             layerAX.set_ylim(-0.1 * vmax, 1.1 * vmax)
             layerAX.legend()
@@ -392,6 +624,28 @@ def plot_fr_ranked(nested_firing_rates, stimulus_names = None, ylim=150, percent
 
 
 
+def _plot_layer_lines(ax, x, values):
+    """
+    Plot one line per layer as a single collection, with a legend entry for each layer
+    :param ax: axis to plot in
+    :param x: x values of shape [n_points]
+    :param values: numpy array of shape [n_points, layer]
+    """
+    n_points, n_layer = values.shape
+    colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    layer_colors = [colors[l % len(colors)] for l in range(n_layer)]
+
+    segments = np.empty((n_layer, n_points, 2))
+    segments[:, :, 0] = x
+    segments[:, :, 1] = values.T
+
+    # an open, unfilled PolyCollection draws the same lines as a LineCollection, but legend(loc='best') takes its
+    # vertices into account when placing the legend (for a LineCollection it only looks at the offsets)
+    ax.add_collection(PolyCollection(segments, closed=False, facecolors='none', edgecolors=layer_colors, linewidths=plt.rcParams['lines.linewidth']))
+    ax.autoscale_view()
+    ax.legend([Line2D([], [], color=c) for c in layer_colors], ["Layer {}".format(l) for l in range(n_layer)])
+
+
 def plot_information_difference_development(info, threshold):
     """
     plot how the difference in information between 2 stimuli developed
@@ -403,15 +657,12 @@ def plot_information_difference_development(info, threshold):
     if(n_objects !=2):
         raise NotImplementedError("At the moment, it only knows how to compare 2 objects.")
 
-    avg_info = np.mean(info, axis=3)
+    avg_info, n_above_threshold = _mean_and_count_at_least(info, threshold)
 
     avg_info_1_minus_0 = avg_info[:, 1, :] - avg_info[:, 0, :]
 
     avg_max = np.max(avg_info_1_minus_0)
 
-    n_above_threshold = np.count_nonzero( (info >= threshold), axis=3 )
-
-
     above_max_1_minus_0 = n_above_threshold[:, 1, :] - n_above_threshold[:, 0, :]
     max_n_above_threshold = np.max(above_max_1_minus_0)
 
@@ -428,13 +679,8 @@ def plot_information_difference_development(info, threshold):
     axN_neurons.set_ylim(-1.1 * max_n_above_threshold, 1.1 * max_n_above_threshold)
     axN_neurons.set_title("Number of neurons above {}".format(threshold))
 
-    for l in range(n_layer):
-
-        axAvg.plot(avg_info_1_minus_0[:, l], label= "Layer {}".format(l))
-        axN_neurons.plot(above_max_1_minus_0[:, l], label="Layer {}".format(l))
-
-    axAvg.legend()
-    axN_neurons.legend()
+    _plot_layer_lines(axAvg, np.arange(n_epochs), avg_info_1_minus_0)
+    _plot_layer_lines(axN_neurons, np.arange(n_epochs), above_max_1_minus_0)
 
 def plot_information_development(info, epochs=None, mean_of_top_n = 'all', threshold=0.8, item_label=None, lower_y_lim=0):
     """
@@ -459,15 +705,16 @@ def plot_information_development(info, epochs=None, mean_of_top_n = 'all', thres
     else:
         assert(len(item_label) == n_objects)
 
-    if mean_of_top_n == 'all':
-        avg_info = np.mean(info, axis=3)
-    else:
-        info_top_n = np.sort(info, axis=3)[:, :, :, -1-mean_of_top_n:]
+    # mean and number of neurons above threshold in one pass over info
+    avg_info, n_above_threshold = _mean_and_count_at_least(info, threshold)
+
+    if mean_of_top_n != 'all':
+        # same neurons as the slice [-1-mean_of_top_n:] of the sorted info would give
+        n_top = len(range(n_neurons)[-1-mean_of_top_n:])
+        info_top_n = _largest_descending(info, n_top)
         avg_info = np.mean(info_top_n, axis=3)
 
     avg_max = np.max(avg_info)
-
-    n_above_threshold = np.count_nonzero( (info >= threshold), axis=3 )
     n_above_max = np.max(n_above_threshold)
 
     fig = plt.figure(figsize=(18, 15))
@@ -484,13 +731,8 @@ def plot_information_development(info, epochs=None, mean_of_top_n = 'all', thres
         axN_neurons.set_ylim(0, 1.1 * n_above_max)
         axN_neurons.set_title("Number of neurons above {}".format(threshold))
 
-        for l in range(n_layer):
-
-            axAvg.plot(avg_info[:, i, l], label= "Layer {}".format(l))
-            axN_neurons.plot(epochs, n_above_threshold[:, i, l], label="Layer {}".format(l))
-
-        axAvg.legend()
-        axN_neurons.legend()
+        _plot_layer_lines(axAvg, np.arange(n_epochs), avg_info[:, i, :])
+        _plot_layer_lines(axN_neurons, epochs, n_above_threshold[:, i, :])
 
     return fig
 
@@ -505,12 +747,19 @@ def plot_firing_rates_colored_by_object(firing_rates, object_list, title_string)
     ax = fig.add_subplot(1,1,1)
     ax.set_title("Firing Rates for Stimulus presentations, colored by object which contains the indicated stimuli")
 
-    for obj in object_list:
-        ids_in_obj = obj['indices']
+    if len(object_list) == 0:
+        # nothing to plot, leave the axis empty
+        return
 
-        ax.plot(ids_in_obj, firing_rates[ids_in_obj], 'x', label=obj['elements'])
+    colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    object_colors = [colors[i % len(colors)] for i in range(len(object_list))]
 
-    ax.legend()
+    # all stimuli in one scatter, colored by the object they belong to
+    all_ids = np.concatenate([np.asarray(obj['indices'], dtype=int) for obj in object_list])
+    all_colors = to_rgba_array(object_colors)[np.repeat(np.arange(len(object_list)), [len(obj['indices']) for obj in object_list])]
+    ax.scatter(all_ids, firing_rates[all_ids], c=all_colors, marker='x')
+
+    ax.legend([Line2D([], [], color=c, marker='x', linestyle='') for c in object_colors], [str(obj['elements']) for obj in object_list])
 
 
 def plot_mean_rates_by_stim(firing_rates, stimulus_ids, title_string, ylims=(0, 60), threshold=None, comparison_rates=None, rates_label=None, stimulus_sort_key=None):
@@ -723,6 +972,8 @@ def animated_histogram(data, n_bins=10, item_label=None, log=True):
     :param item_label: lables of the items.
     :return:
     """
+    data = _as_float32(data)
+
     n_epochs, n_objects, n_layer, n_neurons = data.shape
     if not item_label:
         item_label = list(range(n_objects))
@@ -734,25 +985,34 @@ def animated_histogram(data, n_bins=10, item_label=None, log=True):
 
     bins = np.linspace(vmin, vmax, n_bins +1)
 
+    # the counts of all frames are computed up front, the frames only change the bar heights
+    counts = _histogram_counts(data, bins)
+    max_count = max(counts.max(), 1)
+
     fig = plt.figure(figsize=(19, 8))
 
-    object_axes = []
+    object_patches = []
     for obj in range(n_objects):
-        layer_in_obj_axes = []
+        layer_in_obj_patches = []
         for l in range(n_layer):
             layer_and_obj_axis = fig.add_subplot(n_layer, n_objects, l * n_objects + obj + 1)
-            layer_and_obj_axis.hist(data[0, obj, l, :], bins=bins, log=log)
+            _, _, patches = layer_and_obj_axis.hist(bins[:-1], bins=bins, weights=counts[0, obj, l], log=log)
+            # fixed limits for all frames, the bottom of the log scale keeps bars of height 1 visible
+            layer_and_obj_axis.set_ylim(0.5 if log else 0, 1.05 * max_count)
             # layer_and_obj_axis.yscale('log', nonposy='clip')
-            layer_in_obj_axes.append(layer_and_obj_axis)
-        object_axes.append(layer_in_obj_axes)
+            layer_in_obj_patches.append(patches)
+        object_patches.append(layer_in_obj_patches)
+
+    all_patches = [rect for layer_in_obj_patches in object_patches for patches in layer_in_obj_patches for rect in patches]
 
     def update_hist(num):
         for obj in range(n_objects):
             for l in range(n_layer):
-                object_axes[obj][l].cla()
-                object_axes[obj][l].hist(data[num, obj, l, :], bins=bins, log=log)
+                for rect, height in zip(object_patches[obj][l], counts[num, obj, l]):
+                    rect.set_height(height)
+        return all_patches
 
-    ani = animation.FuncAnimation(fig, update_hist, n_epochs)
+    ani = animation.FuncAnimation(fig, update_hist, n_epochs, blit=True)
     return ani
 
 
@@ -806,6 +1066,12 @@ def show_connection_fields(synapses, layer, is_excitatory, neuron_positions, net
 
     from . import synapse_analysis
     n_plots = len(neuron_positions)
+    figure_name = "Receptive field for the following neurons in layer {}".format(layer)
+
+    if n_plots == 0:
+        # no neurons, just the empty figure
+        plt.figure(figure_name, figsize=(19,8))
+        return
 
     if is_excitatory:
         input_neuron_layer_side_length = helper.get_side_length(network_architecture["num_exc_neurons_per_layer"])
@@ -814,34 +1080,40 @@ def show_connection_fields(synapses, layer, is_excitatory, neuron_positions, net
         input_neuron_layer_side_length = helper.get_side_length(network_architecture["num_inh_neurons_per_layer"])
 
 
-    fig = plt.figure("Receptive field for the following neurons in layer {}".format(layer), figsize=(19,8))
-    for i,pos in enumerate(neuron_positions):
+    recpFields = synapse_analysis.connection_fields_of_neurons([(layer,) + pos for pos in neuron_positions], is_excitatory, synapses, network_architecture, mode=mode)
 
-        ax = fig.add_subplot(2, np.ceil(n_plots/2), i+1)
+    plotting_layer_side_length = recpFields[0].shape[0]
+    # sidelength of layer in which the receptive field lives (the same for all of them, synapses are of one type)
 
-        if(mode=='sources'):
-            recpField = synapse_analysis.receptive_field_of_neuron((layer,) + pos, is_excitatory, synapses, network_architecture)
-        elif(mode=='targets'):
-            recpField = synapse_analysis.targets_of_neuron((layer,) + pos, is_excitatory, synapses, network_architecture)
-        else:
-            raise ValueError("mode can only be sources, or targets")
+    factor = plotting_layer_side_length / input_neuron_layer_side_length
+    # if for example we are looking at E2I Lateral synapses, then there are different number of neurons in the presynamptic and the postsynaptic layer
+    # this factor mitigates that. the center of the receptive field of inhibitory neuron 16,16 is placed over the excitatory neuron 32, 32
+    # because there are 32x32 inhibitory neurons and 64x64 excitatory ones
 
+    # all fields share one color range and one colorbar
+    field_ranges = [_min_max(recpField) for recpField in recpFields]
+    vmin = min(field_min for field_min, _ in field_ranges)
+    vmax = max(field_max for _, field_max in field_ranges)
 
-        ax.set_title("Neuron at {}, n_synapses: {}".format(pos, np.sum(recpField)))
+    n_columns = -(-n_plots // 2)
+    # plt.figure reuses an existing figure with that name (plt.subplots(num=...) refuses to)
+    fig = plt.figure(figure_name, figsize=(19,8))
+    axes = fig.subplots(2, n_columns, squeeze=False)
+    for ax in axes.flat[n_plots:]:
+        ax.axis('off')
 
-        plotting_layer_side_length = recpField.shape[0]
-        # sidelength of layer in which the receptive field lives
+    for i, (pos, recpField) in enumerate(zip(neuron_positions, recpFields)):
 
-        factor = plotting_layer_side_length / input_neuron_layer_side_length
-        # if for example we are looking at E2I Lateral synapses, then there are different number of neurons in the presynamptic and the postsynaptic layer
-        # this factor mitigates that. the center of the receptive field of inhibitory neuron 16,16 is placed over the excitatory neuron 32, 32
-        # because there are 32x32 inhibitory neurons and 64x64 excitatory ones
+        ax = axes.flat[i]
 
-        im = ax.imshow(recpField, cmap='plasma')
+        ax.set_title("Neuron at {}, n_synapses: {}".format(pos, np.sum(recpField)))
+
+        im = ax.imshow(recpField, cmap='plasma', vmin=vmin, vmax=vmax)
         ax.scatter([pos[1]*factor], [pos[0]*factor], color="green", marker='x', s=500)
-        fig.colorbar(im)
         ax.invert_xaxis()
         ax.invert_yaxis()
         ax.set_ylim(0, recpField.shape[0])
         ax.set_xlim(0, recpField.shape[1])
 
+    fig.colorbar(im, ax=axes.ravel().tolist(), shrink=0.8)
+
@@ -180,10 +180,7 @@ def weighted_presynaptic_actvity(mask, net, weights, firing_rates):
 
     assert(len(pre_ids.shape) == 1)
 
-    neuron_info = [helper.id_to_position(pre_id, network_info, pos_as_2d=False) for pre_id in pre_ids]
-    # each entry has shape (is_excitatory, (layer, pos))
-
-    is_excitatory, position = zip(*neuron_info)
+    is_excitatory, layer_id, neuron_id = helper.ids_to_positions(pre_ids.values, network_info, pos_as_2d=False)
 
     if np.all(is_excitatory):
         relevant_rates = exc_rates
@@ -192,9 +189,6 @@ def weighted_presynaptic_actvity(mask, net, weights, firing_rates):
     else:
         raise ValueError("There are excitatory and inhibitory presynaptic neurons. Blindly summing over them does not seem to make sense")
 
-    layer_id, neuron_id = zip(*position)
-
-
     presynaptic_firing_rates = relevant_rates[:, :, layer_id, neuron_id]
 
     weights = weights[:, mask]
@@ -374,6 +368,34 @@ def targets_of_neuron(pos, is_excitatory, synapses, network_info):
     return _synapse_endpoint_density(post_ids, network_info)
 
 
+def connection_fields_of_neurons(positions, is_excitatory, synapses, network_info, mode='sources'):
+    """
+    receptive_field_of_neuron (mode 'sources') or targets_of_neuron (mode 'targets') for several neurons at once.
+    The synapses are only searched once for all of the neurons.
+
+    :param positions: list of tuples (layer, line, column)
+    :param is_excitatory: true -> the neurons at positions are excitatory
+    :param synapses: synapses should only contain synapses of one type!
+    :param network_info:
+    :param mode: 'sources' or 'targets'
+    :return: list with one numpy array of shape [lines, columns] for each position
+    """
+    if mode == 'sources':
+        own_ids, other_ids = synapses.post.values, synapses.pre.values
+    elif mode == 'targets':
+        own_ids, other_ids = synapses.pre.values, synapses.post.values
+    else:
+        raise ValueError("mode can only be sources, or targets")
+
+    ids = [helper.position_to_id(pos, is_excitatory, network_info) for pos in positions]
+
+    relevant = np.isin(own_ids, ids)
+    own_ids = own_ids[relevant]
+    other_ids = other_ids[relevant]
+
+    return [_synapse_endpoint_density(other_ids[own_ids == id], network_info) for id in ids]
+
+
 def _synapse_endpoint_density(target_ids, network_info):
     """
     aranges a set of target ids in a numpy array representing the layer. This is a generic function for calculating 'receptive fields'
@@ -385,11 +407,11 @@ def _synapse_endpoint_density(target_ids, network_info):
     :return:
     """
 
-    target_positions = [helper.id_to_position(i, network_info) for i in target_ids]
+    is_exc, layers, lines, columns = helper.ids_to_positions(target_ids, network_info)
 
     # determine layer in which the receptive field is
-    target_layer = target_positions[0][1][0] # first target neuron, second value is the position -> (layer, line, column)
-    target_is_exc = target_positions[0][0] # flag if the target layer (i.e. the one from wich the connections come) is excitatory
+    target_layer = layers[0] # layer of the first target neuron
+    target_is_exc = is_exc[0] # flag if the target layer (i.e. the one from wich the connections come) is excitatory
 
     if target_is_exc:
         n_per_relevant_layer = network_info["num_exc_neurons_per_layer"]
@@ -400,13 +422,10 @@ def _synapse_endpoint_density(target_ids, network_info):
 
     receptive_field = np.zeros((side_length, side_length))
 
-    for target_pos in target_positions:
-        current_is_exc, current_pos = target_pos
-        current_layer, current_line, current_column = current_pos
-        if(current_is_exc != target_is_exc or current_layer != target_layer):
-            raise ValueError("Not all presynaptic neurons are in the same layer")
+    if np.any(is_exc != target_is_exc) or np.any(layers != target_layer):
+        raise ValueError("Not all presynaptic neurons are in the same layer")
 
-        receptive_field[current_line, current_column] += 1
+    np.add.at(receptive_field, (lines, columns), 1)
 
     return receptive_field
 
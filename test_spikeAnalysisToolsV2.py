@@ -1,4 +1,7 @@
+import os
+import shutil
 import sys
+import tempfile
 import unittest
 from timeit import default_timer as timer
 
@@ -13,6 +16,7 @@ import helper as helper
 import combine_stimuli as combine
 import information_scores as info
 import synapse_analysis as synapse_analyis
+import _fast_parse
 
 
 
@@ -123,12 +127,196 @@ class Test_Weights(unittest.TestCase):
         assert(np.all(unique))
 
 
-
-
-
-
-
-
+class Test_FastParse(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, content):
+        path = os.path.join(self.folder, "values.txt")
+        with open(path, "wb") as file:
+            file.write(content)
+        return path
+
+    def test_ints_like_loadtxt(self):
+        path = self.write(b"3 7\n-12 0\r\n\n0 1\n+5 -2\r\n\n123456789 8\n-2147483648 9")
+        parsed = _fast_parse.load_int_column(path, dtype=np.int32)
+        expected = np.loadtxt(path, dtype=np.int32, usecols=0, ndmin=1)
+        assert(parsed.dtype == np.int32)
+        assert(np.array_equal(parsed, expected))
+
+    def test_comma_separated_like_loadtxt(self):
+        path = self.write(b"1,2.5\n-4,1e3\n")
+        assert(np.array_equal(_fast_parse.load_int_column(path), np.loadtxt(path, dtype=np.int32, delimiter=",", usecols=0)))
+
+    def test_floats_like_loadtxt(self):
+        path = self.write(b"0.25\n-1.5e-3\r\n\n3E5 1\n+12.125\n.5\n7.\n-0\n1e+2\nnan\n-inf\nInfinity\n")
+        parsed = _fast_parse.load_float_column(path, dtype=np.float32)
+        expected = np.loadtxt(path, dtype=np.float32, usecols=0, ndmin=1)
+        assert(parsed.dtype == np.float32)
+        np.testing.assert_array_equal(parsed, expected)
+
+    def test_empty_file(self):
+        path = self.write(b"")
+        assert(len(_fast_parse.load_int_column(path)) == 0)
+        assert(len(_fast_parse.load_float_column(path)) == 0)
+
+    def test_invalid_entries_raise(self):
+        for content in [b"1\n-\n", b"+\n", b"12a\n", b"abc\n", b"1.5\n"]:
+            with self.assertRaises(ValueError):
+                _fast_parse.load_int_column(self.write(content))
+        for content in [b"1\n-\n", b".\n", b"1e\n", b"infx\n", b"abc\n"]:
+            with self.assertRaises(ValueError):
+                _fast_parse.load_float_column(self.write(content))
+
+    def test_overflow_raises(self):
+        with self.assertRaises(OverflowError):
+            _fast_parse.load_int_column(self.write(b"1\n99999999999999999999\n"), dtype=np.int64)
+        with self.assertRaises(OverflowError):
+            _fast_parse.load_int_column(self.write(b"1\n2147483648\n"), dtype=np.int32)
+        assert(_fast_parse.load_int_column(self.write(b"2147483648\n"), dtype=np.int64)[0] == 2147483648)
+
+
+class Test_RandomNeuronsOfType(unittest.TestCase):
+    network = dict(num_exc_neurons_per_layer=16, num_inh_neurons_per_layer=4, num_layers=3)
+
+    def setUp(self):
+        np.random.seed(42)
+        self.mask = helper.NeuronMask(Test_RandomNeuronsOfType.network)
+
+    def check(self, ids, n_to_draw, restricting_functions):
+        assert(len(ids) == n_to_draw)
+        assert(len(np.unique(ids)) == n_to_draw)
+        assert(np.all((0 <= ids) & (ids < self.mask.n_all_neurons)))
+        for fun in restricting_functions:
+            assert(np.all(fun(ids)))
+
+    def test_id_ranges(self):
+        # restrictions that are turned into id ranges, drawing a few (rejection of duplicates) and the whole pool (np.random.choice)
+        in_layer_1 = helper.Caller(self.mask.is_in_layer, 1)
+        cases = [
+            ([], self.mask.n_all_neurons),
+            ([self.mask.is_excitatory], 3 * 16),
+            ([self.mask.is_inhibitory], 3 * 4),
+            ([self.mask.is_excitatory, in_layer_1], 16),
+            ([in_layer_1, self.mask.is_inhibitory], 4),
+        ]
+        for restrictions, pool_size in cases:
+            assert(self.mask._id_ranges_for_restrictions(restrictions) is not None)
+            for n_to_draw in [1, pool_size // 3, pool_size]:
+                ids = self.mask.get_ids_of_random_neurons_of_type(n_to_draw, restrictions)
+                self.check(ids, n_to_draw, restrictions)
+            if pool_size == self.mask.n_all_neurons:
+                continue
+            with self.assertRaises(ValueError):
+                self.mask.get_ids_of_random_neurons_of_type(pool_size + 1, restrictions)
+
+    def test_single_function_instead_of_list(self):
+        ids = self.mask.get_ids_of_random_neurons_of_type(10, self.mask.is_excitatory)
+        self.check(ids, 10, [self.mask.is_excitatory])
+
+    def test_rejection_sampling(self):
+        even = lambda ids: ids % 2 == 0
+        restrictions = [even, self.mask.is_excitatory]
+        assert(self.mask._id_ranges_for_restrictions(restrictions) is None)
+        ids = self.mask.get_ids_of_random_neurons_of_type(5, restrictions)
+        self.check(ids, 5, restrictions)
+
+    def test_full_pool_fallback(self):
+        # 20 out of 20480 neurons are valid, drawing random candidates will (almost) never find all of them
+        mask = helper.NeuronMask(dict(num_exc_neurons_per_layer=64*64, num_inh_neurons_per_layer=32*32, num_layers=4))
+        valid = np.arange(1000, 1020)
+        checked_sizes = []
+
+        def is_valid(ids):
+            checked_sizes.append(len(ids))
+            return np.isin(ids, valid)
+
+        ids = mask.get_ids_of_random_neurons_of_type(20, [is_valid])
+        assert(max(checked_sizes) == mask.n_all_neurons)
+        assert(np.array_equal(np.sort(ids), valid))
+
+    def test_more_than_pool_raises(self):
+        with self.assertRaises(ValueError):
+            self.mask.get_ids_of_random_neurons_of_type(1, [lambda ids: ids < 0])
+        with self.assertRaises(ValueError):
+            self.mask.get_ids_of_random_neurons_of_type(3, [lambda ids: ids == 5])
+        with self.assertRaises(ValueError):
+            self.mask.get_ids_of_random_neurons_of_type(3 * 16 + 1, [self.mask.is_excitatory])
+
+
+class Test_SplitNeuronTables(unittest.TestCase):
+    network = dict(num_exc_neurons_per_layer=16, num_inh_neurons_per_layer=4, num_layers=3)
+
+    def setUp(self):
+        np.random.seed(0)
+        n = 200
+        # shuffled, non default index to check that the index of the selected rows is kept
+        self.frame = pd.DataFrame({
+            'ids': np.random.randint(0, 60, n).astype(np.int32),
+            'times': np.random.rand(n).astype(np.float32)
+        }, index=np.random.permutation(1000)[:n])
+        self.arrays = helper.NeuronArrays.from_frame(self.frame)
+
+    def assert_same(self, from_frame, from_arrays, expected):
+        assert(isinstance(from_frame, pd.DataFrame))
+        assert(isinstance(from_arrays, helper.NeuronArrays))
+        pd.testing.assert_frame_equal(from_frame, expected)
+        pd.testing.assert_frame_equal(from_arrays.to_frame(index=expected.index), expected)
+
+    def test_split_into_layers(self):
+        layers_frame = helper.split_into_layers(self.frame, self.network)
+        layers_arrays = helper.split_into_layers(self.arrays, self.network)
+        assert(len(layers_frame) == len(layers_arrays) == 3)
+        for l in range(3):
+            expected = self.frame[self.frame.ids // 20 == l].copy()
+            expected['ids'] = expected.ids % 20
+            self.assert_same(layers_frame[l], layers_arrays[l], expected)
+
+    def test_split_exc_inh(self):
+        one_layer = self.frame[self.frame.ids < 20]
+        exc_frame, inh_frame = helper.split_exc_inh(one_layer, self.network)
+        exc_arrays, inh_arrays = helper.split_exc_inh(helper.NeuronArrays.from_frame(one_layer), self.network)
+
+        self.assert_same(exc_frame, exc_arrays, one_layer[one_layer.ids < 16])
+        expected_inh = one_layer[one_layer.ids >= 16].copy()
+        expected_inh['ids'] = expected_inh.ids - 16
+        self.assert_same(inh_frame, inh_arrays, expected_inh)
+
+    def test_split_into_populations(self):
+        populations_frame = helper.split_into_populations(self.frame, self.network)
+        populations_arrays = helper.split_into_populations(self.arrays, self.network)
+        ranges = helper.get_population_neuron_range(self.network)
+        assert(set(populations_frame) == set(populations_arrays) == set(ranges))
+        for name, (start, end) in ranges.items():
+            expected = self.frame[(start <= self.frame.ids) & (self.frame.ids < end)]
+            self.assert_same(populations_frame[name], populations_arrays[name], expected)
+
+    def test_neuron_arrays_indexing(self):
+        mask = self.frame.ids.values > 30
+        pd.testing.assert_frame_equal(self.arrays[mask].to_frame(index=self.frame.index[mask]), self.frame[mask])
+        assert(np.array_equal(self.arrays['times'], self.frame.times.values))
+        assert('ids' in self.arrays and len(self.arrays) == len(self.frame))
+
+class Test_SplitStimuli(unittest.TestCase):
+    def test_integer_times(self):
+        spikes = pd.DataFrame({'ids': [3, 1, 4, 1], 'times': [0, 1, 2, 4]}, index=[10, 11, 12, 13])
+        stimuli = helper.splitstimuli(spikes, 1.5)
+        assert(len(stimuli) == 3)
+        assert([list(s.times) for s in stimuli] == [[0, 1], [0.5], [1.0]])
+        assert([list(s.ids) for s in stimuli] == [[3, 1], [4], [1]])
+        # the rows keep their labels from the original frame
+        assert([list(s.index) for s in stimuli] == [[10, 11], [12], [13]])
+
+    def test_empty_last_stimulus(self):
+        spikes = pd.DataFrame({'ids': [0, 1], 'times': np.array([0.2, 1.1], dtype=np.float32)})
+        stimuli = helper.splitstimuli(spikes, 1.0, num_stimuli=3)
+        assert(len(stimuli) == 3)
+        assert(len(stimuli[2]) == 0)
+        assert(stimuli[1].times.dtype == np.float32)
+        assert(np.allclose(stimuli[1].times, [0.1]))
 
 
 